@@ -1,14 +1,38 @@
+import os
+import threading
 from flask import Flask
 from config import Config
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
 app = Flask(__name__)
-app.config.from_object(Config)
+app.config.from_object(os.environ.get('APP_CONFIG') or Config)
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
-from app import routes, models
+from app import database, instrumentation, metrics, profiling, routes, models
 
 from app.api import bp as api_bp
 app.register_blueprint(api_bp, url_prefix='/api')
+
+from app.api import buffer, scheduler
+
+_background_lock = threading.Lock()
+_background_started = False
+
+
+# Starts the enabled background threads, which write buffered games and prepare each day's puzzle before it begins.
+# They are started on the first request rather than on import, so CLI commands such as "flask db upgrade" never run
+# them. (the async tier starts them once it is serving, refer to app/aio/routes.py)
+@app.before_first_request
+def start_background_threads():
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+
+    if app.config['GAME_WRITE_BEHIND']:
+        buffer.games.start(app, app.config['GAME_FLUSH_INTERVAL'], app.config['GAME_MAX_DIRTY'])
+    if app.config['PUZZLE_PREWARM']:
+        scheduler.scheduler.start(app, app.config['PUZZLE_PREWARM_LEAD'])
@@ -0,0 +1,27 @@
+import os
+from datetime import timedelta
+from quart import Quart, Blueprint
+from config import Config
+from app import app
+
+# An asyncio-native tier of the app, serving the same routes and responses as the WSGI tier under an ASGI server.
+# Requests wait on the database without holding a thread, although with SQLite's single writer as the limit it is no
+# faster than the WSGI tier. (compare them with "python -m tests.loadtest --compare-tiers")
+# Its responses report their queries through the same Server-Timing header and debug log, but the debug log does not
+# attribute awaited queries to the functions that made them, and requests are never sampled by the profiler
+# (PROFILE_RATE), as cProfile cannot separate the requests that share the event loop's thread.
+# Run with "hypercorn asgi:app" from the project directory. (refer to asgi.py)
+# The handlers read the Flask app's config, and the Flask app remains the source of the models and of the sync loaders
+# of the cached puzzle and dictionary.
+
+aio_app = Quart(__name__, root_path=app.root_path, template_folder=app.template_folder,
+                static_folder=app.static_folder)
+aio_app.config.from_object(os.environ.get('APP_CONFIG') or Config)
+aio_app.permanent_session_lifetime = timedelta(days=365)
+
+# The blueprint's name matches the WSGI tier's, so the templates build the same URLs.
+bp = Blueprint('api', __name__)
+
+from app.aio import routes, api
+
+aio_app.register_blueprint(bp, url_prefix='/api')
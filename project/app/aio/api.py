@@ -0,0 +1,265 @@
+import json
+import uuid
+from quart import request, session, g, Response
+from sqlalchemy import select
+from werkzeug.http import HTTP_STATUS_CODES, generate_etag
+from app import app, metrics
+from app.models import User, Game, Puzzle, Statistics
+from app.api import load, game as game_api, stats, cache, dictionary, positions, buffer, users
+from app.aio import bp
+from app.aio.database import get_session, run_sync
+
+# The async handlers of the api routes, which mirror those of app/api and share their logic.
+# Queries are awaited on the async engine, while the scoring, positions and caches are reused as they are.
+
+
+# Builds a JSON response in the same form as Flask's jsonify.
+def json_response(payload, status_code=200):
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':')) + "\n"
+    return Response(body, status=status_code, content_type='application/json')
+
+
+# Generates an error response based off the input status code and provided message. (refer to app/api/errors.py)
+def error_response(status_code, message=None):
+    if status_code is not None:
+        payload = {'success': False, 'error': HTTP_STATUS_CODES.get(status_code, 'Unknown error')}
+    else:
+        payload = {'success': False}
+
+    if message:
+        payload['message'] = message
+
+    return json_response(payload, status_code or 200)
+
+
+# Gets the current day's puzzle from the puzzle cache, loading it in a worker thread when the day changes.
+async def get_daily_puzzle():
+    puzzle = cache.daily_puzzle.peek()
+    if puzzle is None:
+        puzzle = await run_sync(load.get_daily_puzzle)
+    return puzzle
+
+
+# Ensures the dictionary is loaded, loading it in a worker thread if it is not.
+async def load_dictionary():
+    if not dictionary.index.is_loaded():
+        await run_sync(dictionary.index.get_lists)
+
+
+# Checks if the current user exists in the database, through the same index of UserIDs as load.is_valid_user.
+# Users known to the index are found without leaving the event loop, while other UserIDs are checked in a worker thread,
+# which may load the index or bring it up to date with the users created by other processes.
+async def is_valid_user(userid):
+    if not isinstance(userid, str):
+        return False
+    if users.index.is_known(userid):
+        return True
+
+    return await run_sync(users.index.exists, userid)
+
+
+# Generates a UserID that does not exist in the database and inserts it into the database.
+async def generate_userid():
+    while True:
+        new_userid = str(uuid.uuid4()).replace("-", "")
+        if not await is_valid_user(new_userid):
+            session['userid'] = new_userid
+            get_session().add(User(userid=new_userid))
+            await get_session().commit()
+            users.index.add(new_userid)
+            metrics.users_created.inc()
+            break
+
+
+# Gets the context of the user's current game, which is loaded once and reused for the rest of the request.
+async def get_game_context():
+    if 'game_context' not in g:
+        puzzle = await get_daily_puzzle()
+        result = await get_session().execute(load.game_context_statement(session['userid'], session['gameid'],
+                                                                          puzzle.puzzleid))
+        g.game_context = load.make_game_context(result.first())
+
+    return g.game_context
+
+
+# Changes the current UserID to a new one if it exists in the database.
+@bp.route('/load/changeuser', methods=['PUT'])
+async def change_userid():
+    data = await request.get_data()
+    if len(data) == 0:
+        error_message = "No UserID was entered."
+        return error_response(None, error_message)
+
+    userid = await request.get_json()
+
+    if await is_valid_user(userid):
+        session['userid'] = userid
+        return json_response({"success": True})
+
+    error_message = "This UserID is currently not linked to any account."
+    return error_response(None, error_message)
+
+
+# Finds the current user's game (or generates one) and then returns data to allow for it to be loaded.
+@bp.route('/load/game', methods=['PUT'])
+async def load_game():
+    if session['userid'] is None or session['gameid'] is None:
+        error_message = "Something went wrong! Try reloading the page."
+        return error_response(400, error_message)
+
+    # The context is loaded first, as it clears the cached puzzle if the puzzle has been updated.
+    context = await get_game_context()
+    puzzle = await get_daily_puzzle()
+    game = context.game if context is not None else None
+    if game is None:
+        # Checks if the user has a game for the current day already.
+        result = await get_session().execute(select(Game).where(Game.userid == session['userid'],
+                                                                Game.puzzleid == puzzle.puzzleid).limit(1))
+        game = result.scalars().first()
+        if game is not None:
+            session['gameid'] = game.gameid
+            buffer.games.restore(game)
+        else:
+            # Generates a new game if invalid, checking the cached puzzle against its row first.
+            cache.daily_puzzle.check(await get_session().get(Puzzle, puzzle.puzzleid))
+            puzzle = await get_daily_puzzle()
+            game = Game(userid=session['userid'], puzzleid=puzzle.puzzleid,
+                        gpositions=positions.new_guess_positions(len(puzzle.unique_letters)),
+                        lpositions=positions.new_letter_positions())
+            get_session().add(game)
+            await get_session().commit()
+            session['gameid'] = game.gameid
+
+    gpositions, lpositions = positions.positions_to_json(game.gpositions, game.lpositions)
+
+    return json_response({"success": True,
+                          "letters": json.dumps(list(puzzle.letters)),
+                          "uniqueletters": json.dumps(list(puzzle.letter_indexes)),
+                          "guessCount": game.guesses,
+                          "status": game.status,
+                          "gpositions": gpositions,
+                          "lpositions": lpositions})
+
+
+# Saves the turns played on the current game, with their outcomes, in a single transaction. (refer to app/api/game.py)
+async def save_turns(context, outcomes):
+    game = context.game
+    db_session = get_session()
+    if 'win' in outcomes or 'loss' in outcomes:
+        await db_session.execute(stats.record_games_statement(game.puzzleid, *game_api.get_game_totals(game)))
+        buffer.games.discard(game)
+        await db_session.commit()
+    elif 'valid' in outcomes:
+        if app.config['GAME_WRITE_BEHIND']:
+            full = buffer.games.store(game)
+            await db_session.rollback()
+            if full:
+                await run_sync(buffer.games.flush)
+        else:
+            await db_session.commit()
+
+    game_api.count_outcomes(outcomes)
+
+
+# Gets the context of the current game with the dictionary loaded, so its turns can be played.
+# Returns the context, the puzzle's unique letters and an error response, which is None unless the game is invalid.
+async def get_playable_context():
+    if session['userid'] is None or session['gameid'] is None:
+        error_message = "Something went wrong! Try reloading the page."
+        return None, None, error_response(400, error_message)
+
+    context = await get_game_context()
+    if context is None:
+        error_message = "The current game is invalid, please reload the page."
+        return None, None, error_response(None, error_message)
+
+    await load_dictionary()
+    return context, list((await get_daily_puzzle()).unique_letters), None
+
+
+# Validates the words input into the server. (refer to app/api/game.py)
+@bp.route('/game/guess', methods=['POST'])
+async def check_guess():
+    context, unique_letters, error = await get_playable_context()
+    if error is not None:
+        return error
+
+    guesses = await request.get_json()
+
+    response, outcome = game_api.play_turn(context, guesses, unique_letters)
+    await save_turns(context, [outcome])
+    return json_response(response)
+
+
+# Validates and plays several turns at once. (refer to app/api/game.py)
+@bp.route('/game/guesses', methods=['POST'])
+async def check_guesses():
+    context, unique_letters, error = await get_playable_context()
+    if error is not None:
+        return error
+
+    turns = await request.get_json(silent=True)
+    if not game_api.is_valid_turns(turns):
+        error_message = "Between 1 and {} turns of three words must be sent.".format(game_api.max_batch_turns)
+        return error_response(400, error_message)
+
+    results, outcomes = [], []
+    for guesses in turns:
+        response, outcome = game_api.play_turn(context, guesses, unique_letters)
+        results.append(response)
+        outcomes.append(outcome)
+
+    # The game's state is read before it is saved, as buffering it rolls back the session and expires the game.
+    status, guess_count = context.game.status, context.game.guesses
+    await save_turns(context, outcomes)
+    return json_response({"success": True,
+                          "results": results,
+                          "status": status,
+                          "guessCount": guess_count})
+
+
+# Gets the statistics for the current puzzle or all puzzles. (refer to app/api/stats.py)
+@bp.route('/stats/game', methods=['GET'])
+async def get_game_statistics():
+    userid = request.args.get('userid', '')
+    dtype = request.args.get('type', '')
+
+    if dtype != 'user' and dtype != 'population':
+        dtype = None
+
+    if not dtype or not await is_valid_user(userid):
+        error_message = "Incorrect data was input."
+        return error_response(400, error_message)
+
+    db_session = get_session()
+    result = await db_session.execute(select(User).where(User.userid == userid).limit(1))
+    user = result.scalars().first()
+
+    # Population statistics are shared with the cache of the WSGI tier's handler.
+    puzzleid = stats.all_puzzles if dtype == 'user' else (await get_daily_puzzle()).puzzleid
+    key = (dtype, puzzleid)
+    rates = cache.population_statistics.peek(key)
+    if rates is None:
+        rates = stats.get_population_rates(await db_session.get(Statistics, puzzleid))
+        cache.population_statistics.put(key, rates, app.config['STATS_CACHE_TTL'])
+
+    win_rate, average_guesses = rates
+    total_guesses, user_winrate = stats.get_user_statistics(user)
+
+    response = json_response({"success": True,
+                              "userGuesses": user.game_guesses,
+                              "totalGuesses": total_guesses,
+                              "userwinrate": user_winrate,
+                              "winrate": win_rate,
+                              "averageGuesses": average_guesses})
+
+    # Clients revalidating unchanged statistics receive a 304 response instead.
+    etag = generate_etag(await response.get_data(as_text=False))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if request.if_none_match and request.if_none_match.contains_weak(etag):
+        response = Response(b"", status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+
+    return response
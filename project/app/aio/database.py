@@ -0,0 +1,59 @@
+import asyncio
+from quart import g
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app import app, db
+
+# The async engines of each database URI, created on first use so the URI can be changed (such as by the tests).
+_engines = {}
+
+
+# Gets the async engine of the current database, which uses the same SQLite file as the WSGI tier through aiosqlite.
+def get_engine():
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    engine = _engines.get(uri)
+    if engine is None:
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+        engine = create_async_engine(uri.replace('sqlite://', 'sqlite+aiosqlite://', 1),
+                                     poolclass=AsyncAdaptedQueuePool,
+                                     pool_size=options.get('pool_size', 5),
+                                     max_overflow=options.get('max_overflow', 10),
+                                     pool_timeout=options.get('pool_timeout', 30))
+        _engines[uri] = engine
+
+    return engine
+
+
+# Disposes of every async engine, closing their connections.
+async def dispose_engines():
+    for engine in list(_engines.values()):
+        await engine.dispose()
+    _engines.clear()
+
+
+# Gets the async session of the current request, which is closed when the request ends.
+def get_session():
+    if 'db_session' not in g:
+        g.db_session = AsyncSession(get_engine(), expire_on_commit=False)
+
+    return g.db_session
+
+
+async def close_session():
+    session = g.pop('db_session', None)
+    if session is not None:
+        await session.close()
+
+
+# Calls a synchronous function of the WSGI tier in a worker thread, within an app context of the Flask app.
+# Used for the rare loads of the cached puzzle and dictionary, for checking UserIDs unknown to the index of UserIDs
+# and for flushing buffered games.
+async def run_sync(function, *args):
+    def call():
+        with app.app_context():
+            try:
+                return function(*args)
+            finally:
+                db.session.remove()
+
+    return await asyncio.to_thread(call)
@@ -0,0 +1,67 @@
+import time
+from quart import render_template, session, request, g, Response
+from app import metrics, instrumentation, start_background_threads
+from app.aio import aio_app
+from app.aio.api import is_valid_user, generate_userid
+from app.aio.database import close_session
+
+
+# Starts the enabled background threads of the app once the server is serving.
+@aio_app.before_serving
+async def start_background():
+    start_background_threads()
+
+
+# Sets the current session to persist for 365 days of inactivity, and starts recording the request's queries.
+@aio_app.before_request
+async def make_session_permanent():
+    session.permanent = True
+    instrumentation.async_queries.set(instrumentation.RequestQueries())
+    if request.blueprint == 'api':
+        g.metrics_start = time.perf_counter()
+
+
+# Records the latency of each request to the api routes, in the same metrics as the WSGI tier.
+@aio_app.after_request
+async def record_request_latency(response):
+    start = g.get('metrics_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.request_latency.observe(time.perf_counter() - start, request.method, route)
+        metrics.request_count.inc(request.method, route, str(response.status_code))
+
+    return response
+
+
+# Reports the queries of the request, through the same Server-Timing header and debug log as the WSGI tier.
+@aio_app.after_request
+async def report_request_queries(response):
+    queries = instrumentation.async_queries.get()
+    if queries is not None:
+        instrumentation.report_queries(queries, response, request.method, request.path)
+    return response
+
+
+@aio_app.teardown_request
+async def close_database_session(exception=None):
+    instrumentation.async_queries.set(None)
+    await close_session()
+
+
+# Sets the route for the index page, initialising any session variables if they do not exist.
+@aio_app.route('/')
+async def index():
+    if 'userid' not in session or not await is_valid_user(session['userid']):
+        await generate_userid()
+
+    # GameID is set to a placeholder of 0 until it is later generated.
+    if 'gameid' not in session:
+        session['gameid'] = 0
+
+    return await render_template('index.html')
+
+
+# Sets the route for the metrics of the app, in the Prometheus text format.
+@aio_app.route('/metrics')
+async def get_metrics():
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4')
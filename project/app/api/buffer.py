@@ -0,0 +1,159 @@
+import atexit
+import threading
+from sqlalchemy.orm.attributes import set_committed_value, flag_modified
+from app import db
+from app.models import Game
+
+
+# Gets the key a game's state is buffered under.
+def state_key(game):
+    return game.gameid, game.puzzleid, game.userid
+
+
+# A write-behind buffer for the state of games in progress.
+# Guesses that do not end a game store the game's state here instead of committing it, and the buffered states are
+# written to the database in batches by a background thread. Games that have ended are always committed immediately,
+# and a buffered state never overwrites a game that has ended or has since made more guesses.
+# Written states are kept until the following flush, so requests that loaded a game while it was being written still
+# restore its latest state.
+# Buffered states are held per process, so this is only suited to running the app as a single process.
+# States are keyed by the game's GameID, PuzzleID and UserID, as SQLite reuses the GameIDs of deleted games (such as
+# those deleted by "flask update" in another process) and a state must never be restored into or written over a
+# different game.
+class GameBuffer(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._states = {}
+        self._dirty = set()
+        self._written = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self.app = None
+        self.max_dirty = 1000
+
+    # Starts the background thread, flushing the buffer every "interval" seconds.
+    # The buffer is also flushed when it holds "max_dirty" games, and when the process exits.
+    def start(self, app, interval=1.0, max_dirty=1000):
+        self.app = app
+        self.max_dirty = max_dirty
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='game-buffer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    # Stops the background thread and flushes any remaining games.
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self.app is not None:
+            with self.app.app_context():
+                self.flush()
+
+    def _run(self, interval):
+        with self.app.app_context():
+            while not self._stop.wait(interval):
+                try:
+                    self.flush()
+                except Exception:
+                    self.app.logger.exception("Failed to flush buffered games.")
+
+    # Buffers the state of a game, flushing the buffer if it is full.
+    # The game's changes are removed from the session, so they are not committed with the rest of the request.
+    def save(self, game):
+        full = self.store(game)
+
+        db.session.rollback()
+        if full:
+            self.flush()
+
+    # Buffers the state of a game, without changing its session.
+    # Returns True if the buffer is full and should be flushed.
+    def store(self, game):
+        with self._lock:
+            key = state_key(game)
+            self._states[key] = (game.guesses, game.gpositions, game.lpositions)
+            self._dirty.add(key)
+            return len(self._dirty) >= self.max_dirty
+
+    # Replaces the loaded state of a game with its buffered state, if it has one.
+    def restore(self, game):
+        state = self._states.get(state_key(game))
+        if state is None:
+            return game
+
+        guesses, gpositions, lpositions = state
+        set_committed_value(game, 'guesses', guesses)
+        set_committed_value(game, 'gpositions', gpositions)
+        set_committed_value(game, 'lpositions', lpositions)
+        return game
+
+    # Removes a game from the buffer, used before its final state is committed.
+    # The game's state is marked as changed, so that it is committed in full even if the final guess left part of its
+    # restored state unchanged.
+    def discard(self, game):
+        with self._lock:
+            key = state_key(game)
+            self._states.pop(key, None)
+            self._dirty.discard(key)
+
+        for attribute in ('guesses', 'gpositions', 'lpositions'):
+            flag_modified(game, attribute)
+
+    # Removes every buffered state without writing it.
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+            self._dirty.clear()
+            self._written.clear()
+
+    # Writes every buffered game to the database in a single transaction.
+    # Returns the number of games written.
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                # Games written by the previous flush and not buffered since are removed.
+                for key in self._written - self._dirty:
+                    self._states.pop(key, None)
+
+                dirty = {key: self._states[key] for key in self._dirty}
+                self._dirty = set()
+                self._written = set(dirty)
+
+            if len(dirty) == 0:
+                return 0
+
+            rows = [{'id': gameid, 'puzzle_id': puzzleid, 'user_id': userid, 'new_guesses': guesses,
+                     'new_gpositions': gpositions, 'new_lpositions': lpositions}
+                    for (gameid, puzzleid, userid), (guesses, gpositions, lpositions) in dirty.items()]
+
+            update = Game.__table__.update()\
+                .where(Game.gameid == db.bindparam('id'))\
+                .where(Game.puzzleid == db.bindparam('puzzle_id'))\
+                .where(Game.userid == db.bindparam('user_id'))\
+                .where(Game.status == 0)\
+                .where(Game.guesses < db.bindparam('new_guesses'))\
+                .values(guesses=db.bindparam('new_guesses'), gpositions=db.bindparam('new_gpositions'),
+                        lpositions=db.bindparam('new_lpositions'))
+
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(update, rows)
+            except Exception:
+                # Marks the games as needing to be written again, unless they have since ended.
+                with self._lock:
+                    self._dirty.update(key for key in dirty if key in self._states)
+                    self._written = set()
+                raise
+
+            return len(rows)
+
+    def __len__(self):
+        return len(self._dirty)
+
+
+games = GameBuffer()
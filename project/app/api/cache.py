@@ -0,0 +1,140 @@
+import threading
+import time
+from datetime import date
+
+
+# Holds the data of a single day's puzzle, all of which is derived once from the puzzle's three words.
+class DailyPuzzle(object):
+    def __init__(self, day, puzzleid, words, wordids=None):
+        self.day = day
+        self.puzzleid = puzzleid
+        self.words = tuple(words)
+        # The WordIDs the puzzle was loaded with, used to find out if the puzzle has since been updated.
+        self.wordids = tuple(wordids) if wordids is not None else None
+
+        # The letters used in the puzzle, with the first occurrence of each connecting letter removed.
+        letters = list("".join(words))
+        for num in range(0, 3):
+            letters.remove(words[num][0])
+        letters.sort()
+        self.letters = tuple(letters)
+
+        # The sorted unique letters of the puzzle.
+        self.unique_letters = tuple(sorted(set("".join(words))))
+
+        # The index of each slot's letter in the unique letters, used to refer to specific letters in gpositions.
+        self.letter_indexes = tuple(self.unique_letters.index(letter) for letter in self.letters)
+
+    def __repr__(self):
+        return '<DailyPuzzle {} ({})>'.format(self.puzzleid, self.day)
+
+
+# A process-wide cache of the current day's puzzle.
+# The cached puzzle is replaced once the date changes, or when it is invalidated after a puzzle is updated.
+# The next day's puzzle may be preloaded, in which case it replaces the cached puzzle as soon as its day begins without
+# any request waiting on the database.
+class PuzzleCache(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._puzzle = None
+        self._next = None
+
+    # Returns the cached puzzle for the given day, using the loader to build it if the cache is empty or stale.
+    # The loader is called with the day and must return a DailyPuzzle.
+    def get(self, loader, day=None):
+        if day is None:
+            day = date.today()
+
+        puzzle = self.peek(day)
+        if puzzle is not None:
+            return puzzle
+
+        # Only one thread loads the puzzle, any others waiting on the lock reuse its result.
+        with self._lock:
+            puzzle = self._puzzle
+            if puzzle is None or puzzle.day != day:
+                puzzle = loader(day)
+                self._puzzle = puzzle
+
+        return puzzle
+
+    # Returns the cached puzzle if it is for the given day, without loading it.
+    # A preloaded puzzle for the day becomes the cached puzzle, in a single assignment.
+    def peek(self, day=None):
+        day = day or date.today()
+        puzzle = self._puzzle
+        if puzzle is not None and puzzle.day == day:
+            return puzzle
+
+        puzzle = self._next
+        if puzzle is not None and puzzle.day == day:
+            self._puzzle = puzzle
+            return puzzle
+        return None
+
+    # Holds a puzzle until its day begins, when it replaces the cached puzzle.
+    def preload(self, puzzle):
+        with self._lock:
+            self._next = puzzle
+
+    # Returns the preloaded puzzle for the given day, if there is one.
+    def peek_next(self, day):
+        puzzle = self._next
+        if puzzle is not None and puzzle.day == day:
+            return puzzle
+        return None
+
+    # Clears the cached or preloaded puzzle with the input Puzzle row's PuzzleID if it was loaded with other words, such
+    # as after the puzzle was updated by another process. (flask update)
+    def check(self, puzzle):
+        wordids = (puzzle.wordid1, puzzle.wordid2, puzzle.wordid3)
+        for cached in (self._puzzle, self._next):
+            if cached is not None and cached.puzzleid == puzzle.puzzleid and cached.wordids != wordids:
+                self.invalidate(puzzle.puzzleid)
+                return
+
+    # Clears the cached and preloaded puzzles. If a PuzzleID is given, only a puzzle with that PuzzleID is cleared.
+    def invalidate(self, puzzleid=None):
+        with self._lock:
+            if puzzleid is None or (self._puzzle is not None and self._puzzle.puzzleid == puzzleid):
+                self._puzzle = None
+            if puzzleid is None or (self._next is not None and self._next.puzzleid == puzzleid):
+                self._next = None
+
+
+# A process-wide cache of values that expire after a number of seconds.
+class TTLCache(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    # Returns the cached value for the key, using the loader to build it if it is missing or older than the TTL.
+    def get(self, key, loader, ttl):
+        value = self.peek(key)
+        if value is not None:
+            return value
+
+        value = loader()
+        self.put(key, value, ttl)
+        return value
+
+    # Returns the cached value for the key if it has not expired, otherwise None.
+    def peek(self, key):
+        entry = self._values.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    # Caches a value for the key for the TTL.
+    def put(self, key, value, ttl):
+        with self._lock:
+            self._values[key] = (time.monotonic() + ttl, value)
+
+    # Clears every cached value.
+    def invalidate(self):
+        with self._lock:
+            self._values.clear()
+
+
+daily_puzzle = PuzzleCache()
+population_statistics = TTLCache()
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import struct
+import threading
+import numpy as np
+from app import app
+from app.api import dictionary
+
+# A catalog of every puzzle the answer words allow, stored as a file of WordID triples that is memory-mapped by the app.
+# Each puzzle is three answer words (word1, word2, word3) where each word starts with the last letter of the word
+# before it, and word1 starts with the last letter of word3. Puzzles are in the order they are enumerated, so every
+# rotation of the same three words is a separate puzzle.
+# The file starts with a header of its magic bytes, the number of puzzles and a hash of the answer words it was built
+# from, followed by the WordIDs of each puzzle as little-endian unsigned 16-bit integers.
+# Build it with "flask build-catalog", and enable it by setting PUZZLE_CATALOG to its path.
+
+magic = b'TRINITY1'
+header = struct.Struct('<8sI32s')
+
+
+# Gets a hash of the answer words of the word lists, which the catalog is only valid for.
+def get_wordlist_hash(lists):
+    digest = hashlib.sha256()
+    for word in lists.answers:
+        digest.update('{}:{}:{}{}\n'.format(word.wordid, word.wordname, word.firstletter, word.lastletter).encode())
+    return digest.digest()
+
+
+# Yields the WordIDs of every puzzle the answer words of the word lists allow.
+def enumerate_puzzles(lists):
+    for word1 in lists.answers:
+        for word2 in lists.by_first.get(word1.lastletter, []):
+            for word3 in lists.by_pair.get((word2.lastletter, word1.firstletter), []):
+                yield word1.wordid, word2.wordid, word3.wordid
+
+
+# Counts the distinct sets of words of the puzzles, counting every rotation of the same three words once.
+def count_distinct(puzzles):
+    # Each set of words is counted by its rotation with the lowest key, comparing the WordIDs in order.
+    def keys(first, second, third):
+        return (puzzles[:, first].astype(np.uint64) << 32) | (puzzles[:, second].astype(np.uint64) << 16) | \
+            puzzles[:, third].astype(np.uint64)
+
+    key = keys(0, 1, 2)
+    return int(np.count_nonzero((key <= keys(1, 2, 0)) & (key <= keys(2, 0, 1))))
+
+
+# Enumerates every puzzle of the word lists and writes them to a catalog at the path, replacing any existing catalog.
+# Returns the puzzles as an array of WordID triples.
+def build_catalog(path, lists):
+    if lists.answers and max(word.wordid for word in lists.answers) > np.iinfo(np.uint16).max:
+        raise ValueError("WordIDs must fit in 16 bits to be stored in a catalog.")
+    puzzles = np.array(list(enumerate_puzzles(lists)), dtype='<u2').reshape(-1, 3)
+
+    # The catalog is written to a temporary file first, so processes with it mapped keep reading the old catalog.
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(header.pack(magic, len(puzzles), get_wordlist_hash(lists)))
+        file.write(puzzles.tobytes())
+    os.replace(temp_path, path)
+
+    return puzzles
+
+
+# A memory-mapped catalog file.
+class Catalog(object):
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            file_magic, count, self.wordlist_hash = header.unpack(file.read(header.size))
+        if file_magic != magic:
+            raise ValueError("{} is not a puzzle catalog.".format(path))
+
+        self.path = path
+        self.puzzles = np.memmap(path, dtype='<u2', mode='r', offset=header.size, shape=(count, 3)) if count else \
+            np.zeros((0, 3), dtype='<u2')
+
+    def __len__(self):
+        return len(self.puzzles)
+
+    # Gets the WordIDs of the puzzle picked for a day, chosen by a hash of the date so each date always has the same
+    # puzzle for the same catalog.
+    def pick(self, day):
+        digest = hashlib.blake2b(str(day).encode(), digest_size=8).digest()
+        wordid1, wordid2, wordid3 = self.puzzles[int.from_bytes(digest, 'little') % len(self.puzzles)]
+        return int(wordid1), int(wordid2), int(wordid3)
+
+
+# The process-wide catalog at the PUZZLE_CATALOG path.
+# The catalog is opened on first use, and is only used while it matches the answer words of the dictionary, so that
+# puzzles are generated as they were without a catalog when the word lists change.
+class CatalogIndex(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._lists = None
+        self._path = None
+
+    # Returns the catalog if one is configured and matches the dictionary, otherwise None.
+    def get(self):
+        path = app.config['PUZZLE_CATALOG']
+        if not path:
+            return None
+
+        lists = dictionary.index.get_lists()
+        with self._lock:
+            if self._lists is not lists or self._path != path:
+                self._catalog, self._lists, self._path = self._open(path, lists), lists, path
+            return self._catalog
+
+    def _open(self, path, lists):
+        try:
+            catalog = Catalog(path)
+        except (OSError, ValueError, struct.error):
+            app.logger.warning("The puzzle catalog %s could not be opened, puzzles are generated without it.", path)
+            return None
+
+        if catalog.wordlist_hash != get_wordlist_hash(lists) or len(catalog) == 0:
+            app.logger.warning("The puzzle catalog %s does not match the answer words, rebuild it with "
+                               "flask build-catalog.", path)
+            return None
+        return catalog
+
+    # Picks the WordIDs of the puzzle for a day from the catalog, or returns None if no catalog is used.
+    def pick(self, day):
+        catalog = self.get()
+        if catalog is None:
+            return None
+        return catalog.pick(day)
+
+    # Closes the catalog, so that it is reopened on its next use.
+    def invalidate(self):
+        with self._lock:
+            self._catalog = None
+            self._lists = None
+            self._path = None
+
+
+index = CatalogIndex()
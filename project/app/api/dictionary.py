@@ -0,0 +1,104 @@
+import threading
+from collections import namedtuple
+from app import db
+from app.models import Word
+
+# A lightweight copy of an answer word's row, used for puzzle generation.
+AnswerWord = namedtuple('AnswerWord', ['wordid', 'wordname', 'firstletter', 'lastletter'])
+
+
+# Holds the words loaded from the Word table.
+# Answer words are kept in WordID order and bucketed by their first letter and by their (first, last) letter pair,
+# matching the order the database returns them in for the equivalent filtered queries.
+class WordLists(object):
+    def __init__(self, rows):
+        self.words = {}
+        self.names = {}
+        self.answers = []
+        self.by_first = {}
+        self.by_pair = {}
+
+        for wordid, wordname, firstletter, lastletter, answer in rows:
+            self.words[wordname] = bool(answer)
+            self.names[wordid] = wordname
+            if not answer:
+                continue
+
+            word = AnswerWord(wordid, wordname, firstletter, lastletter)
+            self.answers.append(word)
+            self.by_first.setdefault(firstletter, []).append(word)
+            self.by_pair.setdefault((firstletter, lastletter), []).append(word)
+
+    def __len__(self):
+        return len(self.words)
+
+
+# An in-memory index of every word in the Word table, allowing words to be validated and puzzles to be generated
+# without querying the database.
+# The index is loaded on first use and is reloaded after it is invalidated (such as after the words are repopulated).
+class Dictionary(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lists = None
+
+    # Loads every word from the database, in WordID order.
+    def load(self):
+        rows = db.session.query(Word.wordid, Word.wordname, Word.firstletter, Word.lastletter, Word.answer)\
+            .order_by(Word.wordid).all()
+        return WordLists(rows)
+
+    # Returns the loaded word lists, loading them if they have not been loaded yet.
+    # An empty Word table is never cached, so words populated later by another process are still found.
+    def get_lists(self):
+        lists = self._lists
+        if lists is not None:
+            return lists
+
+        with self._lock:
+            if self._lists is None:
+                lists = self.load()
+                if len(lists) > 0:
+                    self._lists = lists
+            else:
+                lists = self._lists
+
+        return lists
+
+    # Checks if the word lists have been loaded, so they can be used without querying the database.
+    def is_loaded(self):
+        return self._lists is not None
+
+    # Checks if the input word is a valid guess.
+    def contains(self, word):
+        return word in self.get_lists().words
+
+    # Checks if the input word is an allowed answer word.
+    def is_answer(self, word):
+        return self.get_lists().words.get(word, False)
+
+    # Gets every answer word.
+    def get_answers(self):
+        return self.get_lists().answers
+
+    # Gets the word with the input WordID, or None if it does not exist.
+    def get_name(self, wordid):
+        return self.get_lists().names.get(wordid)
+
+    # Gets every answer word starting with the input letter.
+    def get_answers_from(self, firstletter):
+        return self.get_lists().by_first.get(firstletter, [])
+
+    # Gets every answer word starting and ending with the input letters.
+    def get_answers_between(self, firstletter, lastletter):
+        return self.get_lists().by_pair.get((firstletter, lastletter), [])
+
+    # Clears the loaded words so they are reloaded from the database on their next use.
+    def invalidate(self):
+        with self._lock:
+            self._lists = None
+
+    def __len__(self):
+        return len(self.get_lists())
+
+
+index = Dictionary()
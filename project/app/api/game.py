@@ -1,49 +1,81 @@
 from flask import request, json, jsonify, session
-from app import app, db
+from app import app, db, metrics
 from app.models import User, Game, Puzzle, Word
 from app.api import bp
 import app.api.load as load
+import app.api.stats as stats
+from app.api import dictionary, scoring, positions, buffer
 from app.api.errors import error_response
 
 # The guess limit for all puzzles.
 guess_limit = 10
 
 
-# Processes a user's won game, changing their internally stored statistics as required.
-def process_win():
-    user = User.query.filter_by(userid=session['userid']).first()
+# The greatest number of turns that may be submitted at once.
+max_batch_turns = 50
+
+
+# Saves the turns played on the current game, with their outcomes, in a single transaction.
+# A game that ended is committed alongside its user's statistics and the puzzle's running totals, while a game that is
+# still in progress may be buffered rather than committed.
+def save_turns(context, outcomes):
+    game = context.game
+    if 'win' in outcomes or 'loss' in outcomes:
+        stats.record_games(game.puzzleid, *get_game_totals(game))
+        buffer.games.discard(game)
+        db.session.commit()
+    elif 'valid' in outcomes:
+        if app.config['GAME_WRITE_BEHIND']:
+            buffer.games.save(game)
+        else:
+            db.session.commit()
+
+    count_outcomes(outcomes)
+
+
+# Counts the outcomes of turns in the metrics.
+def count_outcomes(outcomes):
+    for outcome in outcomes:
+        if outcome is not None:
+            metrics.guesses.inc(outcome)
+
+
+# Gets the totals an ended game adds to the running statistics, as (games, wins, guesses on wins).
+def get_game_totals(game):
+    if game.status == 2:
+        return 1, 1, game.guesses
+    return 1, 0, 0
+
+
+# Marks a game as won and adds it to its user's statistics.
+def record_win(context):
+    user = context.user
     user.games_won += 1
 
     # The game status is set to 2, denoting it has been won.
-    game = load.get_game()
+    game = context.game
     game.status = 2
 
     user_guesses = json.loads(user.game_guesses)
     user_guesses[game.guesses - 1] += 1
     user.game_guesses = json.dumps(user_guesses)
 
-    db.session.commit()
-
 
-# Processes a user's lost game, changing their interally stored statistics as required.
-def process_loss():
-    user = User.query.filter_by(userid=session['userid']).first()
-    user.games_lost += 1
+# Marks a game as lost and adds it to its user's statistics.
+def record_loss(context):
+    context.user.games_lost += 1
 
     # The game status is set to 1, denoting it has been lost.
-    game = load.get_game()
-    game.status = 1
-
-    db.session.commit()
+    context.game.status = 1
 
 
 # Updates the letter positions stored within the current game.
-# The positions are stored in the format of a list of 12 characters, each representing a slot in the game.
-def get_letter_pos(lpositions):
+# The positions are stored as 12 bytes, each representing a slot in the game. (refer to positions.py)
+def get_letter_pos(game, lpositions):
     # Converts a string of each character in each guessed word to a list. (15 characters long)
     # Any characters that are a '0' represent a slot that was not submitted as a guess.
     lpositions = list(lpositions)
-    g_lpositions = json.loads(load.get_game().lpositions)
+    g_lpositions = bytearray(game.lpositions)
 
     # Replaces every connecting letter (between two words) with a '#', prioritising those that are a '0'.
     for num in range(0, 3):
@@ -63,18 +95,19 @@ def get_letter_pos(lpositions):
     # Replaces only the letters that are not '0'.
     for index, letter in enumerate(lpositions):
         if not letter == '0':
-            g_lpositions[index] = letter
+            g_lpositions[index] = ord(letter)
 
-    return g_lpositions
+    return bytes(g_lpositions)
 
 
 # Updates the guess positions stored within the current game.
-# This is stored in a list of twelve lists (representing a puzzle slot), each containing
-# an element for a unique letter in the puzzle.
-def get_guess_pos(game, data, guesses):
+# This is stored as twelve runs of bytes (representing a puzzle slot), each containing
+# a byte for a unique letter in the puzzle. (refer to positions.py)
+def get_guess_pos(game, data, guesses, unique_letters=None):
     # Gets the current guess positions and a list of the puzzle's unique letters.
-    gpositions = json.loads(game.gpositions)
-    unique_letters = load.get_unique_letters()
+    gpositions = bytearray(game.gpositions)
+    if unique_letters is None:
+        unique_letters = load.get_unique_letters()
 
     # Iterates through every word in the stored results of the guess check.
     for word_index, word in enumerate(data):
@@ -93,15 +126,100 @@ def get_guess_pos(game, data, guesses):
             # Thus, values of 3 (correct letter and word) are prioritised, and so on.
             curr_index = unique_letters.index(curr_letter)
             existing_index = ((word_index * 5) - word_index + letter_index) % 12
+            index = positions.guess_index(gpositions, existing_index, curr_index)
+
+            if letter > gpositions[index]:
+                gpositions[index] = letter
+
+    return bytes(gpositions)
+
+
+# Checks every word of a turn's guesses, where "None" marks a word that was not guessed.
+# Returns None if every word is valid, otherwise an error message and the outcome it is counted as in the metrics.
+# If several words are invalid, the last of them is reported.
+def validate_guesses(guesses):
+    error = None
+
+    for word in guesses:
+        # If the word is None, ignore it.
+        if word == "None":
+            continue
+        # If any word is under 5 characters, ignore it and mark the turn as invalid.
+        if len(word) != 5:
+            error = ("Words must contain 5 letters!", 'wrong_length')
+            continue
+        # If any word is not a valid word, ignore it and mark the turn as invalid.
+        if not dictionary.index.contains(word):
+            error = ("An invalid word was entered!", 'invalid_word')
+
+    return error
+
+
+# Scores a turn of validated guesses against a puzzle's words and applies it to a game.
+# Returns the state of each guessed letter and the game's status after the turn, without ending the game.
+# Status codes:
+# 0 -> Game in progress.
+# 1 -> Game lost.
+# 2 -> Game won.
+def apply_turn(game, guesses, current_words, unique_letters=None):
+    # Scores the guesses, giving the state of each guessed letter and a string of each correctly placed letter.
+    data, lpositions = scoring.score_turn(tuple(guesses), tuple(current_words))
+
+    # Update gpositions and lpositions in the games data.
+    game.gpositions = get_guess_pos(game, data, guesses, unique_letters)
+    game.lpositions = get_letter_pos(game, lpositions)
+    game.guesses += 1
+
+    # If the game's correct letter positions matches the puzzle's letters, the game has been won.
+    puzzle_lpositions = "".join([current_words[0], current_words[1][1:], current_words[2][1:4]])
+    if puzzle_lpositions == positions.letter_positions_to_string(game.lpositions):
+        return data, 2
+
+    # If the number of guesses exceeds the guess limit or submit has occurred (no 'None' present in the guesses)
+    # then the game is a loss if a win has not already occurred.
+    if game.guesses >= guess_limit or 'None' not in guesses:
+        return data, 1
+
+    return data, 0
 
-            if letter > gpositions[existing_index][curr_index]:
-                gpositions[existing_index][curr_index] = letter
 
-    return gpositions
+# Plays a turn of guesses on the context's game, marking the game as won or lost if the turn ends it.
+# Returns the response to the turn and the turn's outcome in the metrics, which is None if the game had already ended.
+def play_turn(context, guesses, unique_letters=None):
+    # Checks if the current game has already ended.
+    game = context.game
+    if game.status > 0:
+        return {"success": False, "message": "The game has already ended."}, None
+
+    # Checks every word in the list of guesses.
+    error = validate_guesses(guesses)
+    if error is not None:
+        error_message, outcome = error
+        return {"success": False, "message": error_message}, outcome
+
+    data, status = apply_turn(game, guesses, context.words, unique_letters)
+    if status == 2:
+        record_win(context)
+        outcome = 'win'
+    elif status == 1:
+        record_loss(context)
+        outcome = 'loss'
+    else:
+        outcome = 'valid'
+
+    return {"success": True, "response": json.dumps(data), "status": status}, outcome
+
+
+# Checks if a list of turns is valid input, with each turn being a list of three words (or "None").
+def is_valid_turns(turns):
+    if not isinstance(turns, list) or len(turns) == 0 or len(turns) > max_batch_turns:
+        return False
+
+    return all(isinstance(guesses, list) and len(guesses) == 3 and all(isinstance(word, str) for word in guesses)
+               for guesses in turns)
 
 
 # Validates the words input into the server.
-# Should receive '["guess1","guess2","guess3"]' via the POST request.
 @bp.route('/game/guess', methods=['POST'])
 def check_guess():
     if session['userid'] is None or session['gameid'] is None:
@@ -109,123 +227,49 @@ def check_guess():
         return error_response(400, error_message)
 
     # Check if current game is valid for the day's puzzle.
-    if load.get_game() is None:
+    # The game is loaded alongside its user and puzzle, which are reused for the rest of the request.
+    context = load.get_game_context()
+    if context is None:
         error_message = "The current game is invalid, please reload the page."
         return error_response(None, error_message)
 
-    # Checks if the current game has already ended.
-    game = load.get_game()
-    if game.status > 0:
-        error_message = "The game has already ended."
-        return error_response(None, error_message)
-
     # Loads the JSON/String array from the request into Python list.
     guesses = request.get_json()
 
-    # Intialises success (whether the check ended successfully), lpositions (to form a new lpositions list)
-    # and numcorr to track the number of correct letters.
-    success = True
-    lpositions = ""
-    numcorr = 0
-
-    # Initialises two empty lists, containing the guess data and the letters with values of '0's to check against other
-    # words.
-    data, blankletters = [], []
-    current_words = load.get_puzzle_words()
-
-    # Checks every word in the list of guesses.
-    for index, word in enumerate(guesses):
-        # If the word is None, ignore it.
-        if word == "None":
-            data.append("None")
-            lpositions += '00000'
-            continue
-        # If any word is under 5 characters, ignore it and mark success as False.
-        if len(word) != 5:
-            success = False
-            error_message = "Words must contain 5 letters!"
-            continue
-        # If any word is not a valid word, ignore it and mark success as false.
-        word_db = Word.query.filter_by(wordname=word).first()
-        if word_db is None:
-            success = False
-            error_message = "An invalid word was entered!"
-            continue
+    response, outcome = play_turn(context, guesses)
+    save_turns(context, [outcome])
+    return jsonify(response)
 
-        wordcheck = []
-        wordcorrect = []
 
-        # Checks every letter in each guess word, from back to front.
-        for i in range(4, -1, -1):
-            # If the letter matches the same letter in the list of puzzle words, it is correct. (value of 4)
-            if word[i] == current_words[index][i]:
-                wordcheck.append(4)
-                numcorr = numcorr + 1
-                wordcorrect.append(word[i])
+# Validates and plays several turns at once, such as those made by a client while it was offline.
+# Should receive an ordered list of turns, each a list of three words, and responds with the result of each turn as
+# check_guess would. Turns after the game has ended are not played, and every turn is saved in a single transaction.
+@bp.route('/game/guesses', methods=['POST'])
+def check_guesses():
+    if session['userid'] is None or session['gameid'] is None:
+        error_message = "Something went wrong! Try reloading the page."
+        return error_response(400, error_message)
 
-            # If not, the letter is either in the correct word (but different position) or correct position (but
-            # different word).
-            else:
-                wordocc = len(current_words[index].split(word[i])) - 1
-                guessocc = len(word.split(word[i])) - 1
-                wordcorrect.append('0')
-
-                # If the occurrences of same word, different positions in the guess word exceeds the amount in the
-                # actual word then the current letter is a blank position. (value of 1)
-                if guessocc > wordocc:
-                    word = word[:i] + "#" + word[i + 1:]
-                    wordcheck.append(1)
-                    blankletters.append((index, i))
-
-                # Else, the current letter is in the correct word but different position. (value of 3)
-                else:
-                    wordcheck.append(3)
-
-        # Both lists are reversed as the process occurs from back to front.
-        wordcheck.reverse()
-        data.append(wordcheck)
-
-        wordcorrect.reverse()
-        lpositions += "".join(wordcorrect)
-
-    # Scan all data to implement checking exact positions between words. (value of 2)
-    for blank in blankletters:
-        index = blank[0]
-        char = blank[1]
-
-        letter = guesses[index][char]
-        for words in current_words:
-            if words[char] == letter:
-                data[index][char] = 2
-
-    # Status codes:
-    # 0 -> Game in progress.
-    # 1 -> Game lost.
-    # 2 -> Game won.
-    if success:
-        # Update gpositions and lpositions in the games data.
-        game.gpositions = json.dumps(get_guess_pos(game, data, guesses))
-        game.lpositions = json.dumps(get_letter_pos(lpositions))
-        game.guesses += 1
+    context = load.get_game_context()
+    if context is None:
+        error_message = "The current game is invalid, please reload the page."
+        return error_response(None, error_message)
 
-        db.session.commit()
+    turns = request.get_json(silent=True)
+    if not is_valid_turns(turns):
+        error_message = "Between 1 and {} turns of three words must be sent.".format(max_batch_turns)
+        return error_response(400, error_message)
 
-        puzzle_lpositions = "".join([current_words[0],current_words[1][1:],current_words[2][1:4]])
-        game_lpositions = "".join(str(letter) for letter in json.loads(game.lpositions))
-        # If the game's correct letter positions matches the puzzle's letters, the game has been won.
-        if puzzle_lpositions == game_lpositions:
-            process_win()
-            return jsonify({"success": True,
-                            "response": json.dumps(data),
-                            "status": 2})
-
-        # If the number of guesses exceeds the guess limit or submit has occurred (no 'None' present in the guesses)
-        # then the game is a loss if a win has not already occurred.
-        if game.guesses >= guess_limit or 'None' not in guesses:
-            process_loss()
-            return jsonify({"success": True,
-                            "response": json.dumps(data),
-                            "status": 1})
-
-        return jsonify({"success": True, "response": json.dumps(data), "status": 0})
-    return error_response(None, error_message)
+    results, outcomes = [], []
+    for guesses in turns:
+        response, outcome = play_turn(context, guesses)
+        results.append(response)
+        outcomes.append(outcome)
+
+    # The game's state is read before it is saved, as buffering it rolls back the session and expires the game.
+    status, guess_count = context.game.status, context.game.guesses
+    save_turns(context, outcomes)
+    return jsonify({"success": True,
+                    "results": results,
+                    "status": status,
+                    "guessCount": guess_count})
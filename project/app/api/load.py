@@ -1,16 +1,21 @@
-from flask import request, json, jsonify, session
+from flask import request, json, jsonify, session, g
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from collections import namedtuple
 import uuid
 from datetime import date
-from app import app, db
+from app import app, db, metrics
 from app.models import User, Game, Puzzle, Word
 from app.api import bp
-from app.api import words
+from app.api import words, cache, positions, buffer, users
 from app.api.errors import error_response
 
-# Checks if the current user exists in the database.
+# Checks if the current user exists in the database, through the index of UserIDs.
+# UserIDs sent as JSON may be of any type, and only strings can be valid.
 def is_valid_user(userid):
-    user = User.query.filter_by(userid=userid).first()
-    return user is not None
+    if not isinstance(userid, str):
+        return False
+    return users.index.exists(userid)
 
 
 # Generates a UserID that does not exist in the database and inserts it into the database.
@@ -24,6 +29,8 @@ def generate_userid():
             user = User(userid=new_userid)
             db.session.add(user)
             db.session.commit()
+            users.index.add(new_userid)
+            metrics.users_created.inc()
             break
 
 
@@ -45,14 +52,25 @@ def change_userid():
     return error_response(None, error_message)
 
 
-# Gets the current puzzle's ID. Generates a puzzle for the current date if none exists.
-def get_current_puzzleid():
-    puzzle = Puzzle.query.filter_by(date=date.today()).first()
+# Loads the puzzle for an input date into a DailyPuzzle. Generates a week of puzzles if none exists for the date.
+def load_daily_puzzle(day):
+    puzzle = Puzzle.query.filter_by(date=day).first()
     if puzzle is None:
-        words.generate_puzzles(date.today(), 7)
-        puzzle = Puzzle.query.filter_by(date=date.today()).first()
+        metrics.puzzles_generated.inc(amount=words.generate_puzzles(day, 7))
+        puzzle = Puzzle.query.filter_by(date=day).first()
+
+    return cache.DailyPuzzle(day, puzzle.puzzleid, get_puzzle_words(None, puzzle),
+                             (puzzle.wordid1, puzzle.wordid2, puzzle.wordid3))
+
 
-    return puzzle.puzzleid
+# Gets the current day's puzzle from the puzzle cache, loading it from the database when the day changes.
+def get_daily_puzzle():
+    return cache.daily_puzzle.get(load_daily_puzzle, date.today())
+
+
+# Gets the current puzzle's ID. Generates a puzzle for the current date if none exists.
+def get_current_puzzleid():
+    return get_daily_puzzle().puzzleid
 
 
 # Gets a word from an input WordID.
@@ -63,11 +81,11 @@ def get_word(wordid):
 
 # Gets a list of the chosen puzzle's words in the format ['word1','word2','word3'].
 def get_puzzle_words(puzzleid=None, puzzle=None):
-    # If no PuzzleID is defined and no Puzzle is input, the current day's ID is used.
+    # If no PuzzleID is defined and no Puzzle is input, the current day's cached words are used.
     if puzzleid is None and puzzle is None:
-        puzzleid = get_current_puzzleid()
+        return list(get_daily_puzzle().words)
 
-    # If no puzzle is defined, the current day's ID is used to generate a puzzle. (or any input PuzzleID)
+    # If no puzzle is defined, the input PuzzleID is used to find the puzzle.
     if puzzle is None:
         puzzle = Puzzle.query.filter_by(puzzleid=puzzleid).first()
 
@@ -81,29 +99,71 @@ def get_puzzle_words(puzzleid=None, puzzle=None):
 
 # Generates a list of letters used in the current puzzle.
 def get_letters():
-    current_words = get_puzzle_words()
-
-    letters = list("".join(current_words))
-    # Removes the first occurrence of each connecting puzzle letter from the array.
-    for num in range(0,3):
-        letters.remove(current_words[num][0])
-    letters.sort()
-
-    return letters
+    return list(get_daily_puzzle().letters)
 
 
 # Generates a list of unique letters used in the current puzzle.
 def get_unique_letters():
-    unique_letters = list(set("".join(get_puzzle_words())))
-    unique_letters.sort()
+    return list(get_daily_puzzle().unique_letters)
+
+
+# Generates a list of the index of each of the current puzzle's letters in its unique letters.
+def get_letter_indexes():
+    return list(get_daily_puzzle().letter_indexes)
+
+
+# The data used throughout a request on the user's current game.
+GameContext = namedtuple('GameContext', ['user', 'game', 'puzzle', 'words'])
 
-    return unique_letters
+
+# Loads the user's game for the current puzzle with a specific GameID, alongside its user, puzzle and the puzzle's
+# words in a single query. Returns None if no such game exists.
+def load_game_context():
+    row = db.session.execute(game_context_statement(session['userid'], session['gameid'],
+                                                    get_current_puzzleid())).first()
+    return make_game_context(row)
+
+
+# Builds the query used by load_game_context.
+def game_context_statement(userid, gameid, puzzleid):
+    word1, word2, word3 = aliased(Word), aliased(Word), aliased(Word)
+
+    return select(Game, User, Puzzle, word1.wordname, word2.wordname, word3.wordname)\
+        .join(User, User.userid == Game.userid)\
+        .join(Puzzle, Puzzle.puzzleid == Game.puzzleid)\
+        .join(word1, word1.wordid == Puzzle.wordid1)\
+        .join(word2, word2.wordid == Puzzle.wordid2)\
+        .join(word3, word3.wordid == Puzzle.wordid3)\
+        .where(Game.userid == userid, Game.gameid == gameid, Game.puzzleid == puzzleid)\
+        .limit(1)
+
+
+# Builds a GameContext from a row of the game context query, restoring any buffered state of the game.
+# The cached puzzle is cleared if the puzzle's words have changed, so the rest of the request uses its current letters.
+def make_game_context(row):
+    if row is None:
+        return None
+
+    game, user, puzzle, word1, word2, word3 = row
+    cache.daily_puzzle.check(puzzle)
+    return GameContext(user, buffer.games.restore(game), puzzle, [word1, word2, word3])
+
+
+# Gets the context of the user's current game, which is loaded once and reused for the rest of the request.
+def get_game_context():
+    if 'game_context' not in g:
+        g.game_context = load_game_context()
+
+    return g.game_context
 
 
 # Returns the user's game for the current puzzle with a specific GameID.
 def get_game():
-    game = Game.query.filter_by(userid=session['userid'], gameid=session['gameid'], puzzleid=get_current_puzzleid()).first()
-    return game
+    context = get_game_context()
+    if context is None:
+        return None
+
+    return context.game
 
 
 # Gets the user's game for the current puzzle, if it exists.
@@ -114,16 +174,14 @@ def get_user_game():
 
 # Generates a game and inserts it into the database, also stores the generated game as the current game.
 def generate_game():
+    # The cached puzzle is checked against its row first, as it may have been updated by another process.
+    cache.daily_puzzle.check(Puzzle.query.get(get_current_puzzleid()))
     game = Game(userid=session['userid'], puzzleid=get_current_puzzleid())
 
-    # Generates a gpositions list for the game, containing 12 lists each with an element for every individual
+    # Generates the gpositions for the game, containing 12 slots each with an element for every individual
     # unique letter.
-    gpositions = []
-    unique_letters = len(set("".join(get_puzzle_words())))
-
-    for num in range(0,12):
-        gpositions.append([0]*unique_letters)
-    game.gpositions = json.dumps(gpositions)
+    game.gpositions = positions.new_guess_positions(len(get_daily_puzzle().unique_letters))
+    game.lpositions = positions.new_letter_positions()
 
     # Commits the data to the database and stores the GameID as a session variable.
     db.session.add(game)
@@ -141,28 +199,25 @@ def load_game():
         return error_response(400, error_message)
 
     # Checks if the current game is valid for the day's puzzle.
-    if get_game() is None:
+    game = get_game()
+    if game is None:
         game = get_user_game()
         # Checks if the user has a game for the current day already.
         if game is not None:
             session['gameid'] = game.gameid
+            buffer.games.restore(game)
         else:
             # Generates a new game if invalid.
             game = generate_game()
-    else:
-        # Finds the pre-existing game if it is valid.
-        game = get_game()
 
-    unique_letters = get_unique_letters()
-    unique_indexes = get_letters()
-    # Stores the indexes of each unique letter, used to refer to specific letters in the gpositions list.
-    for index, letter in enumerate(unique_indexes):
-        unique_indexes[index] = unique_letters.index(letter)
+    # The packed positions are sent to the client as JSON lists.
+    gpositions, lpositions = positions.positions_to_json(game.gpositions, game.lpositions)
 
+    # The indexes of each unique letter are used to refer to specific letters in the gpositions list.
     return jsonify({"success": True,
                     "letters": json.dumps(get_letters()),
-                    "uniqueletters": json.dumps(unique_indexes),
+                    "uniqueletters": json.dumps(get_letter_indexes()),
                     "guessCount": game.guesses,
                     "status": game.status,
-                    "gpositions": game.gpositions,
-                    "lpositions": game.lpositions})
\ No newline at end of file
+                    "gpositions": gpositions,
+                    "lpositions": lpositions})
\ No newline at end of file
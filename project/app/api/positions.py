@@ -0,0 +1,45 @@
+from flask import json
+
+# A game's positions are stored as packed bytes rather than JSON.
+# Guess positions (gpositions) hold a byte for the state (0 to 4) of each unique letter in each of the 12 slots, slot by
+# slot. Letter positions (lpositions) hold a byte for each of the 12 slots, which is either 0 or the ASCII code of the
+# correct letter found for that slot.
+
+# The number of slots in a puzzle.
+slots = 12
+
+
+# Creates the guess positions of a new game, for a puzzle with the input number of unique letters.
+def new_guess_positions(unique_letters):
+    return bytes(slots * unique_letters)
+
+
+# Creates the letter positions of a new game.
+def new_letter_positions():
+    return bytes(slots)
+
+
+# Gets the index of a unique letter in a slot of packed guess positions.
+def guess_index(gpositions, slot, letter):
+    return slot * (len(gpositions) // slots) + letter
+
+
+# Converts packed guess positions to a list of 12 lists, each containing the state of every unique letter in a slot.
+def guess_positions_to_list(gpositions):
+    unique_letters = len(gpositions) // slots
+    return [list(gpositions[slot * unique_letters:(slot + 1) * unique_letters]) for slot in range(0, slots)]
+
+
+# Converts packed letter positions to a list of 12 elements, each being 0 or the correct letter of a slot.
+def letter_positions_to_list(lpositions):
+    return [0 if letter == 0 else chr(letter) for letter in lpositions]
+
+
+# Converts packed letter positions to a string of the correct letters, with a '0' for any slot without one.
+def letter_positions_to_string(lpositions):
+    return "".join('0' if letter == 0 else chr(letter) for letter in lpositions)
+
+
+# Converts both packed positions to the JSON strings sent to the client.
+def positions_to_json(gpositions, lpositions):
+    return json.dumps(guess_positions_to_list(gpositions)), json.dumps(letter_positions_to_list(lpositions))
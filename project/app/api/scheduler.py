@@ -0,0 +1,84 @@
+import atexit
+import threading
+from datetime import date, datetime, timedelta
+from app import metrics
+from app.api import load, words, cache, dictionary
+
+# The number of days of puzzles that are kept generated ahead of the current day.
+days_ahead = 7
+
+
+# Prepares for the day after the input day (by default the current day), so that its first requests are served as
+# quickly as any others:
+# - A week of puzzles from that day is generated, if any are missing.
+# - The current day's puzzle is cached, and the next day's puzzle is preloaded to replace it once the day begins.
+# - The dictionary is loaded.
+# Returns the number of puzzles generated and the preloaded puzzle.
+def prewarm(day=None):
+    if day is None:
+        day = date.today()
+    next_day = day + timedelta(days=1)
+
+    # Puzzles generated by another process in the meantime are kept. (refer to app/api/words.py)
+    # They are counted apart from the puzzles generated on demand, which should stay at 0 while prewarming works.
+    count = words.generate_puzzles(next_day, days_ahead)
+    metrics.puzzles_prewarmed.inc(amount=count)
+
+    cache.daily_puzzle.get(load.load_daily_puzzle, day)
+    puzzle = load.load_daily_puzzle(next_day)
+    cache.daily_puzzle.preload(puzzle)
+
+    dictionary.index.get_lists()
+
+    return count, puzzle
+
+
+# Gets the time that the day after "now" should be prepared at, which is "lead" seconds before its midnight.
+def next_run(now, lead):
+    run_at = datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) - timedelta(seconds=lead)
+    if run_at <= now:
+        run_at += timedelta(days=1)
+    return run_at
+
+
+# A background thread that prepares each day before it begins. (refer to prewarm)
+# The day is prepared once the thread starts, and then "lead" seconds before every midnight.
+# Each process prepares its own caches, while puzzles generated by several processes at once do not conflict.
+class PrewarmScheduler(object):
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+        self.app = None
+
+    # Starts the background thread, preparing each day "lead" seconds before it begins.
+    def start(self, app, lead=600):
+        self.app = app
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(lead,), name='puzzle-prewarm', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    # Stops the background thread.
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, lead):
+        while True:
+            with self.app.app_context():
+                try:
+                    count, puzzle = prewarm()
+                    self.app.logger.info("Prepared puzzle %s for %s, generating %s puzzles.", puzzle.puzzleid,
+                                         puzzle.day, count)
+                except Exception:
+                    self.app.logger.exception("Failed to prepare the next day's puzzle.")
+
+            now = datetime.now()
+            if self._stop.wait((next_run(now, lead) - now).total_seconds()):
+                break
+
+
+scheduler = PrewarmScheduler()
@@ -0,0 +1,115 @@
+from functools import lru_cache
+import numpy as np
+
+# Letter states:
+# 0 -> The word was not guessed.
+# 1 -> The letter is not in the word or any other word at that position.
+# 2 -> The letter is not in the word, but another word has the letter at that position.
+# 3 -> The letter is in the word, but at a different position.
+# 4 -> The letter is in the correct position of the word.
+
+# Marks each pair of positions (i, j) where j is at or after i, used to count occurrences from the back of a word.
+_FROM_BACK = np.triu(np.ones((5, 5), dtype=bool))
+
+
+# Scores a guessed word against its answer word, returning the state of each letter and a list of the blank
+# positions (letters with a state of 1) that may instead be at the same position in another word.
+def score_word(word, answer):
+    wordcheck = [0] * 5
+    blankletters = []
+
+    # Checks every letter in the guess word, from back to front.
+    for i in range(4, -1, -1):
+        # If the letter matches the same letter in the answer word, it is correct. (value of 4)
+        if word[i] == answer[i]:
+            wordcheck[i] = 4
+            continue
+
+        # If not, the letter is either in the correct word (but different position) or correct position (but
+        # different word).
+        wordocc = answer.count(word[i])
+        guessocc = word.count(word[i])
+
+        # If the occurrences of same word, different positions in the guess word exceeds the amount in the
+        # actual word then the current letter is a blank position. (value of 1)
+        # The letter is then removed from the guess word, so that earlier occurrences of it are not counted twice.
+        if guessocc > wordocc:
+            word = word[:i] + "#" + word[i + 1:]
+            wordcheck[i] = 1
+            blankletters.append(i)
+
+        # Else, the current letter is in the correct word but different position. (value of 3)
+        else:
+            wordcheck[i] = 3
+
+    return wordcheck, blankletters
+
+
+# Scores a turn of up to three guessed words against the puzzle's answer words.
+# Guessed words must be validated beforehand, with "None" marking a word that was not guessed.
+# Returns a tuple of each word's letter states (or "None") and a 15 character string of the correctly placed letters,
+# with a '0' for any other letter. Results are cached, as many players submit the same guesses.
+@lru_cache(maxsize=65536)
+def score_turn(guesses, answers):
+    data = []
+    lpositions = ""
+
+    for index, word in enumerate(guesses):
+        # If the word is None, ignore it.
+        if word == "None":
+            data.append("None")
+            lpositions += '00000'
+            continue
+
+        wordcheck, blankletters = score_word(word, answers[index])
+
+        # Scan all blank letters to implement checking exact positions between words. (value of 2)
+        for char in blankletters:
+            if any(answer[char] == word[char] for answer in answers):
+                wordcheck[char] = 2
+
+        data.append(tuple(wordcheck))
+        lpositions += "".join(letter if state == 4 else '0' for letter, state in zip(word, wordcheck))
+
+    return tuple(data), lpositions
+
+
+# Converts a sequence of word triples into an array of letter codes with the shape (N, 3, 5).
+# Words that are "None" (or None) are given codes of 0.
+def encode_words(triples):
+    blank = "\0" * 5
+    letters = "".join(blank if word is None or word == "None" else word for triple in triples for word in triple)
+
+    return np.frombuffer(letters.encode('ascii'), dtype=np.uint8).reshape(len(triples), 3, 5)
+
+
+# Scores many turns at once, each being a triple of guessed words against a triple of answer words.
+# Accepts sequences of word triples or arrays of letter codes from encode_words, and returns an array of letter states
+# with the shape (N, 3, 5). Words that were not guessed have states of 0.
+# The results are identical to those of score_turn.
+def score_batch(guesses, answers):
+    guesses = guesses if isinstance(guesses, np.ndarray) else encode_words(guesses)
+    answers = answers if isinstance(answers, np.ndarray) else encode_words(answers)
+    guessed = (guesses != 0).all(axis=2)
+
+    exact = guesses == answers
+    inexact = ~exact
+
+    # Counts the occurrences of each guessed letter in its guess word and in its answer word.
+    same_letter = guesses[..., :, None] == guesses[..., None, :]
+    guessocc = same_letter.sum(axis=3)
+    wordocc = (guesses[..., :, None] == answers[..., None, :]).sum(axis=3)
+
+    # Letters are removed from the back of the guess word while they occur more often than in the answer word, so
+    # a letter is blank when its rank among the incorrect occurrences of that letter, counted from the back, is within
+    # the number of excess occurrences.
+    rank = (same_letter & inexact[..., None, :] & _FROM_BACK).sum(axis=3)
+    blank = inexact & (rank <= guessocc - wordocc)
+
+    # Blank letters found at the same position in any answer word are instead in a different word.
+    other_word = (guesses[:, :, None, :] == answers[:, None, :, :]).any(axis=2)
+
+    states = np.where(exact, 4, np.where(blank, np.where(other_word, 2, 1), 3)).astype(np.int8)
+    states[~guessed] = 0
+
+    return states
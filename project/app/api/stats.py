@@ -1,37 +1,102 @@
 import math
 from flask import request, json, jsonify, session
-from app.models import User, Game
-from app import db
-from app.api import bp
+from sqlalchemy import func, case
+from sqlalchemy.dialects.sqlite import insert
+from app.models import User, Game, Statistics
+from app import app, db
+from app.api import bp, cache
 import app.api.load as load
 from app.api.errors import error_response
 
+# The PuzzleID that the statistics of all puzzles are stored under.
+all_puzzles = 0
+
 # Rounds a value to the given decimal places, rounding up at 0.5 and upwards and vice versa.
 def round_value(number, decimals):
     decimals = 10**decimals
     return math.floor(number * decimals + 0.5)/decimals
 
-# Gets the statistics for the current puzzle or all puzzles, for all users.
-def get_puzzle_statistics(type, user=None):
+# Adds to the running totals of finished games, won games and guesses on won games of a puzzle and of all puzzles.
+# Negative values are used to remove games. The change is made in the current transaction and must be committed.
+def record_games(puzzleid, games, wins, win_guesses):
+    db.session.execute(record_games_statement(puzzleid, games, wins, win_guesses))
+
+
+# Builds the upsert statement used by record_games.
+def record_games_statement(puzzleid, games, wins, win_guesses):
+    values = [{'puzzleid': puzzleid, 'games': games, 'wins': wins, 'win_guesses': win_guesses},
+              {'puzzleid': all_puzzles, 'games': games, 'wins': wins, 'win_guesses': win_guesses}]
+
+    statement = insert(Statistics).values(values)
+    return statement.on_conflict_do_update(index_elements=['puzzleid'],
+                                           set_={'games': Statistics.games + statement.excluded.games,
+                                                 'wins': Statistics.wins + statement.excluded.wins,
+                                                 'win_guesses': Statistics.win_guesses +
+                                                 statement.excluded.win_guesses})
+
+
+# Counts the finished games, won games and guesses on won games of every puzzle from the Game table.
+# Returns a dictionary of each PuzzleID (and all puzzles) to its totals.
+def count_games():
+    rows = db.session.query(Game.puzzleid,
+                            func.count(Game.gameid),
+                            func.count(case((Game.status == 2, 1))),
+                            func.coalesce(func.sum(case((Game.status == 2, Game.guesses))), 0))\
+        .filter(Game.status > 0).group_by(Game.puzzleid).all()
+
+    totals = {}
+    for puzzleid, games, wins, win_guesses in rows:
+        totals[puzzleid] = (games, wins, win_guesses)
+    totals[all_puzzles] = tuple(sum(column) for column in zip((0, 0, 0), *totals.values()))
+
+    return totals
+
+
+# Rebuilds the statistics of every puzzle from the Game table.
+# Returns a list of the statistics that had drifted, as tuples of (PuzzleID, stored totals, counted totals).
+def rebuild_statistics(commit=True):
+    stored = {row.puzzleid: (row.games, row.wins, row.win_guesses) for row in Statistics.query.all()}
+    counted = count_games()
+
+    drift = []
+    for puzzleid in sorted(set(stored) | set(counted)):
+        stored_totals = stored.get(puzzleid, (0, 0, 0))
+        counted_totals = counted.get(puzzleid, (0, 0, 0))
+        if stored_totals != counted_totals:
+            drift.append((puzzleid, stored_totals, counted_totals))
+
+    if commit:
+        Statistics.query.delete()
+        db.session.execute(Statistics.__table__.insert(),
+                           [{'puzzleid': puzzleid, 'games': games, 'wins': wins, 'win_guesses': win_guesses}
+                            for puzzleid, (games, wins, win_guesses) in counted.items()])
+        db.session.commit()
+        cache.population_statistics.invalidate()
+
+    return drift
+
+
+# Gets the PuzzleID that the statistics of the type are stored under.
+def get_statistics_puzzleid(type):
     # If the type is 'user' all puzzles are checked.
     # If the type is 'population' only the current day's puzzle is checked.
     if type == 'user':
-        games = Game.query.filter_by().all()
-    else:
-        games = Game.query.filter_by(puzzleid=load.get_current_puzzleid()).all()
+        return all_puzzles
 
-    total_games = 0
-    total_wins = 0
-    total_guesses = 0
+    return load.get_current_puzzleid()
 
-    # Iterates through every game with the chosen puzzles, incrementing variables to track statistics.
-    for game in games:
-        if game.status > 0:
-            total_games += 1
 
-        if game.status == 2:
-            total_wins += 1
-            total_guesses += game.guesses
+# Gets the win rate and average guesses per win for the current puzzle or all puzzles, for all users.
+def get_population_statistics(type):
+    # The running totals are read rather than counting every game.
+    return get_population_rates(Statistics.query.get(get_statistics_puzzleid(type)))
+
+
+# Gets the win rate and average guesses per win from a puzzle's statistics, which may be None if it has no games.
+def get_population_rates(statistics):
+    total_games, total_wins, total_guesses = 0, 0, 0
+    if statistics is not None:
+        total_games, total_wins, total_guesses = statistics.games, statistics.wins, statistics.win_guesses
 
     # Returns a rounded win rate percentage and a rounded average guesses per win.
     win_rate, average_guesses = 0, 0
@@ -41,19 +106,33 @@ def get_puzzle_statistics(type, user=None):
     if total_wins != 0:
         average_guesses = int(round_value(total_guesses/total_wins, 0))
 
-    # If user is input into the function, gets the total guesses and win rate for that input user.
-    if user is not None:
-        total_guesses = sum(json.loads(user.game_guesses))
-        total_games = user.games_won + user.games_lost
+    return win_rate, average_guesses
+
+
+# Gets the total guesses on won games and the win rate of an input user.
+def get_user_statistics(user):
+    total_guesses = sum(json.loads(user.game_guesses))
+    total_games = user.games_won + user.games_lost
+
+    user_winrate = 0
+    if total_games != 0:
+        user_winrate = int(round_value(user.games_won / (user.games_won + user.games_lost) * 100, 0))
+
+    return total_guesses, user_winrate
 
-        user_winrate = 0
-        if total_games != 0:
-            user_winrate = int(round_value(user.games_won / (user.games_won + user.games_lost) * 100, 0))
 
+# Gets the statistics for the current puzzle or all puzzles, for all users.
+def get_puzzle_statistics(type, user=None):
+    win_rate, average_guesses = get_population_statistics(type)
+
+    # If user is input into the function, gets the total guesses and win rate for that input user.
+    if user is not None:
+        total_guesses, user_winrate = get_user_statistics(user)
         return win_rate, average_guesses, total_guesses, user_winrate
     return win_rate, average_guesses
 
 # Gets the statistics for the current puzzle or all puzzles, including user-specific and population statistics.
+# Population statistics are cached for a short time, as they change slowly and are requested by every player.
 # Should receive 'userid=inputuserid' and 'type=inputtype' as parameters via the GET request.
 @bp.route('/stats/game', methods=['GET'])
 def get_game_statistics():
@@ -72,13 +151,19 @@ def get_game_statistics():
 
     # Gets population statistics for the chosen puzzles and the input user.
     user = User.query.filter_by(userid=userid).first()
-    win_rate, average_guesses, total_guesses, user_winrate = get_puzzle_statistics(dtype, user)
+    win_rate, average_guesses = cache.population_statistics.get((dtype, get_statistics_puzzleid(dtype)),
+                                                                lambda: get_population_statistics(dtype),
+                                                                app.config['STATS_CACHE_TTL'])
+    total_guesses, user_winrate = get_user_statistics(user)
 
     # Returns the statistics that were requested.
-    return jsonify({"success": True,
-                    "userGuesses": user.game_guesses,
-                    "totalGuesses": total_guesses,
-                    "userwinrate": user_winrate,
-                    "winrate": win_rate,
-                    "averageGuesses": average_guesses})
-
+    # The response is tagged so that clients revalidating unchanged statistics receive a 304 response instead.
+    response = jsonify({"success": True,
+                        "userGuesses": user.game_guesses,
+                        "totalGuesses": total_guesses,
+                        "userwinrate": user_winrate,
+                        "winrate": win_rate,
+                        "averageGuesses": average_guesses})
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
@@ -0,0 +1,115 @@
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from app import app, db
+from app.models import User
+
+
+# A Bloom filter of strings, which may report false positives but never false negatives.
+class BloomFilter(object):
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    # Gets the bit positions of a value, by double hashing a single digest.
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + num * second) % self.size for num in range(0, self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+# A process-wide index of the UserIDs in the database, so that checking if a user exists rarely needs a query.
+# Recently checked users are kept in an LRU, and every UserID is kept in a Bloom filter:
+# - A UserID in the LRU exists, without a query.
+# - A UserID not in the Bloom filter may have been created by another process, so users created since the index was
+#   last brought up to date (with a greater ID than its watermark) are first added. It is only then known not to exist.
+# - Any other UserID is looked up, as the Bloom filter may have given a false positive.
+# Users are never removed from the index, so the app should be restarted after users are deleted. (flask clear all)
+class UserIndex(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known = OrderedDict()
+        self._bloom = None
+        self._watermark = 0
+
+    # Checks if a user with the UserID exists.
+    def exists(self, userid):
+        if self.is_known(userid):
+            return True
+
+        with self._lock:
+            if self._bloom is None or self._bloom.count > self._bloom.capacity:
+                self._load()
+            if userid not in self._bloom:
+                self._catch_up()
+                if userid not in self._bloom:
+                    return False
+
+        if User.query.filter_by(userid=userid).first() is None:
+            return False
+
+        self.remember(userid)
+        return True
+
+    # Checks if the UserID is a recently checked user that is known to exist, without querying the database.
+    def is_known(self, userid):
+        if userid not in self._known:
+            return False
+
+        with self._lock:
+            if userid in self._known:
+                self._known.move_to_end(userid)
+        return True
+
+    # Adds a UserID known to exist to the LRU, and to the Bloom filter if it is loaded.
+    def remember(self, userid):
+        with self._lock:
+            self._known[userid] = True
+            self._known.move_to_end(userid)
+            while len(self._known) > app.config['USER_CACHE_SIZE']:
+                self._known.popitem(last=False)
+
+            if self._bloom is not None and userid not in self._bloom:
+                self._bloom.add(userid)
+
+    # Adds a newly created user to the index.
+    def add(self, userid):
+        self.remember(userid)
+
+    # Loads every UserID into a new Bloom filter, with room for the users to double.
+    def _load(self):
+        rows = db.session.query(User.id, User.userid).all()
+        self._bloom = BloomFilter(max(len(rows) * 2, app.config['USER_INDEX_CAPACITY']))
+        self._watermark = 0
+        self._add_rows(rows)
+
+    # Adds the users created since the watermark to the Bloom filter.
+    def _catch_up(self):
+        self._add_rows(db.session.query(User.id, User.userid).filter(User.id > self._watermark).all())
+
+    def _add_rows(self, rows):
+        for userid_key, userid in rows:
+            self._bloom.add(userid)
+            self._watermark = max(self._watermark, userid_key)
+
+    # Clears the index, so that it is reloaded on its next use.
+    def invalidate(self):
+        with self._lock:
+            self._known.clear()
+            self._bloom = None
+            self._watermark = 0
+
+
+index = UserIndex()
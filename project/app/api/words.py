@@ -1,92 +1,154 @@
-from flask import json
+import json
+from collections import namedtuple
+from sqlalchemy import bindparam, func
 from app import db
 from app.models import User, Word, Puzzle, Game
-import app.api.load as load
+import app.api.stats as stats
+from app.api import cache, dictionary, catalog
 from datetime import date, timedelta
 import random
 
 
 # Returns a string summarising a single puzzle's data when input with a puzzle object.
 def get_puzzle_data(puzzle):
-    words = load.get_puzzle_words(None, puzzle)
+    return next(format_puzzle_views([get_puzzle_view(puzzle)]))
 
-    return_string = "Puzzle: "
-    if puzzle.puzzleid is not None:
-        return_string = "Puzzle " + str(puzzle.puzzleid) + ": "
 
-    for word in words:
-        return_string += word + " "
-    return_string += "(" + str(puzzle.date) + ")"
+# The date and words of a puzzle, as displayed by the view commands. Puzzles that have not been generated have no ID.
+PuzzleView = namedtuple('PuzzleView', ['puzzleid', 'date', 'words'])
 
-    return return_string
+# The formats that puzzle views can be displayed in.
+view_formats = ['text', 'csv', 'json']
+
+
+# Gets the view of an input puzzle, taking its words from the dictionary.
+def get_puzzle_view(puzzle):
+    return PuzzleView(puzzle.puzzleid, puzzle.date,
+                      tuple(dictionary.index.get_name(wordid) for wordid in (puzzle.wordid1, puzzle.wordid2,
+                                                                              puzzle.wordid3)))
+
+
+# Yields the view of the puzzle of each of "n" days, starting from the input date.
+# The puzzles are read in a single query as they are yielded, and days without a puzzle yield the puzzle that would
+# be generated for them.
+def view_puzzles(start_date, n):
+    last_date = start_date + timedelta(days=n - 1)
+    rows = iter(Puzzle.query.filter(Puzzle.date >= start_date, Puzzle.date <= last_date).order_by(Puzzle.date)
+                .yield_per(500))
+
+    puzzle = next(rows, None)
+    for day in range(0, n):
+        day = start_date + timedelta(days=day)
+        if puzzle is not None and puzzle.date == day:
+            yield get_puzzle_view(puzzle)
+            puzzle = next(rows, None)
+        else:
+            yield get_puzzle_view(generate_puzzle(day))
+
+
+# Yields the lines displaying the input puzzle views in a format. (refer to view_formats)
+# CSV has a header line and JSON is a single array, with one puzzle on each line.
+def format_puzzle_views(views, view_format='text'):
+    if view_format == 'csv':
+        yield 'puzzleid,date,word1,word2,word3'
+        for view in views:
+            yield ','.join(['' if view.puzzleid is None else str(view.puzzleid), str(view.date)] + list(view.words))
+    elif view_format == 'json':
+        separator = '['
+        for view in views:
+            yield separator + json.dumps({'puzzleid': view.puzzleid, 'date': str(view.date), 'words': view.words})
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+    else:
+        for view in views:
+            name = "Puzzle: " if view.puzzleid is None else "Puzzle " + str(view.puzzleid) + ": "
+            yield name + " ".join(view.words) + " (" + str(view.date) + ")"
+
+
+# Reads the words of a word list as rows of the Word table, one line at a time.
+def read_wordlist(path, answer):
+    with open(path, 'r') as wordlist:
+        for word in wordlist:
+            word = word.strip()
+            if len(word) == 5:
+                yield {'wordname': word, 'firstletter': word[0], 'lastletter': word[-1], 'answer': answer}
 
 
 # Loads the Word table with all the words in the word lists.
 # Words are loaded in alphabetical order, per list, to prevent any puzzles breaking from previous populations.
+# The words are replaced in a single transaction, with the rows inserted in batches.
 # Word lists were obtained from (which were originally extracted from Wordle):
 # https://gist.github.com/cfreshman/a03ef2cba789d8cf00c08f767e0fad7b
 # https://gist.github.com/cfreshman/cdcdf777450c5b5301e439061d29694c
-def populate_database():
+def populate_database(batch_size=2000):
     # Clears all words from the database.
-    words = Word.query.all()
-    for word in words:
-        db.session.delete(word)
-
-    db.session.commit()
+    Word.query.delete()
 
     # Defines two word lists that are located in the words folder.
     # The first list must only contain potential answers to puzzles. (commonly used words)
     wordlists = ['app/api/words/word-answers.txt','app/api/words/word-guesses.txt']
-    answer = True
+    insert = Word.__table__.insert()
     count = 0
 
     # For each wordlist, load the words within it into the database.
     for index, wordlist in enumerate(wordlists):
-        wordlist = open(wordlist, 'r')
-        for word in wordlist:
-            # If it is the first list, all the words are answers.
-            if index == 1:
-                answer = False
+        # If it is the first list, all the words are answers.
+        rows = []
+        for row in read_wordlist(wordlist, index == 0):
+            rows.append(row)
+            if len(rows) == batch_size:
+                db.session.execute(insert, rows)
+                count += len(rows)
+                rows = []
 
-            word = word.strip()
-            if len(word) == 5:
-                word = Word(wordname=word, firstletter=word[0], lastletter=word[-1], answer=answer)
-                count += 1
-                db.session.add(word)
-        wordlist.close()
+        if len(rows) > 0:
+            db.session.execute(insert, rows)
+            count += len(rows)
 
     db.session.commit()
+
+    # The dictionary is reloaded with the new words and any cached puzzle may refer to WordIDs that have since changed.
+    dictionary.index.invalidate()
+    cache.daily_puzzle.invalidate()
     return count
 
 # Generates a puzzle for an input date. Each date has a puzzle that is the same, no matter how many times it is
 # generated for that day.
+# Candidate words are taken from the in-memory dictionary in the same order the Word table would return them, so
+# each date's puzzle is unchanged from when they were queried from the database.
 def generate_puzzle(day):
-    # Sets the seed for random generation to the date as a string. (ensures that each date always has the same puzzle)
-    random.seed(str(day))
+    # Seeds a generator with the date as a string. (ensures that each date always has the same puzzle)
+    # Each puzzle uses its own generator so that puzzles can be generated from several threads at once.
+    rng = random.Random(str(day))
+
+    # Picks the puzzle from the catalog of every puzzle instead, if one is used. (refer to app/api/catalog.py)
+    wordids = catalog.index.pick(day)
+    if wordids is not None:
+        return Puzzle(wordid1=wordids[0], wordid2=wordids[1], wordid3=wordids[2], date=day)
 
     while True:
-        # Generates a list of every word object and then shuffles the list.
-        words = Word.query.filter_by(answer=True).all()
-        random.shuffle(words)
+        # Copies the list of every answer word and then shuffles the list.
+        words = list(dictionary.index.get_answers())
+        rng.shuffle(words)
         # Generates a random word from this list.
-        index = random.randint(0, 50000) % len(words)
+        index = rng.randint(0, 50000) % len(words)
         word1 = words[index]
 
         # Selects only words with a matching connecting letter.
-        words = Word.query.filter_by(firstletter=word1.lastletter, answer=True).all()
-        random.shuffle(words)
+        words = list(dictionary.index.get_answers_from(word1.lastletter))
+        rng.shuffle(words)
         # If the length of the list is 0, the entire loop continues
         # to ensure that the function does not get stuck on an impossible starting/ending letter combination.
         if len(words) > 0:
-            index = random.randint(0, 50000) % len(words)
+            index = rng.randint(0, 50000) % len(words)
             word2 = words[index]
         else:
             continue
 
-        words = Word.query.filter_by(firstletter=word2.lastletter, lastletter=word1.firstletter, answer=True).all()
-        random.shuffle(words)
+        words = list(dictionary.index.get_answers_between(word2.lastletter, word1.firstletter))
+        rng.shuffle(words)
         if len(words) > 0:
-            index = random.randint(0, 50000) % len(words)
+            index = rng.randint(0, 50000) % len(words)
             word3 = words[index]
         else:
             continue
@@ -98,48 +160,171 @@ def generate_puzzle(day):
 
 
 # Generates several puzzles for "n" number of days, starting from the initial input date.
-# These puzzles are committed to the database automatically.
+# These puzzles are committed to the database automatically, returning the number of puzzles that were inserted.
 def generate_puzzles(puzzle_date, n):
-    # Reduces the date input by 1 so that a puzzle is generated for the input date too.
-    puzzle_date -= timedelta(days=1)
+    last_date = puzzle_date + timedelta(days=n - 1)
 
-    # Generates a puzzle for every subsequent day.
+    # Finds every day in the range that already has a puzzle in a single query.
+    existing_dates = set(day for day, in db.session.query(Puzzle.date)
+                         .filter(Puzzle.date >= puzzle_date, Puzzle.date <= last_date))
+
+    # Generates a puzzle for every day that does not have one, before any writes are made to the database.
+    rows = []
     for day in range(0, n):
-        puzzle_date += timedelta(days=1)
+        day = puzzle_date + timedelta(days=day)
+        if day in existing_dates:
+            continue
 
-        # Checks if a puzzle for the day already exists.
-        puzzle = Puzzle.query.filter_by(date=puzzle_date).first()
-        if puzzle is None:
-            db.session.add(generate_puzzle(puzzle_date))
+        puzzle = generate_puzzle(day)
+        rows.append({'wordid1': puzzle.wordid1, 'wordid2': puzzle.wordid2, 'wordid3': puzzle.wordid3, 'date': day})
 
-    # Commits the puzzles to the database.
+    if len(rows) == 0:
+        return 0
+
+    # Inserts the puzzles in a single transaction. Puzzles inserted for the same day by another process in the meantime
+    # are kept, rather than failing on the unique date.
+    insert = Puzzle.__table__.insert().prefix_with('OR IGNORE', dialect='sqlite')
+    result = db.session.execute(insert, rows)
     db.session.commit()
 
+    return result.rowcount
+
+
+# The number of games that are reverted in each transaction when a puzzle is updated.
+revert_chunk_size = 1000
+
+
+# The changes made by reverting the games of a puzzle: the games deleted, and the users and finished games reverted.
+RevertSummary = namedtuple('RevertSummary', ['games', 'users', 'finished', 'wins', 'win_guesses'])
+
+
+# Gets the results of the games of a puzzle, or only of the games with the input GameIDs, grouped by user.
+# Returns a dictionary of each UserID to its losses and a dictionary of its wins by the number of guesses, and the
+# number of games.
+def get_puzzle_results(puzzleid, gameids=None):
+    query = db.session.query(Game.userid, Game.status, Game.guesses, func.count(Game.gameid))\
+        .filter(Game.puzzleid == puzzleid)
+    if gameids is not None:
+        query = query.filter(Game.gameid.in_(gameids))
+
+    results, games = {}, 0
+    for userid, status, guesses, count in query.group_by(Game.userid, Game.status, Game.guesses):
+        losses, wins = results.setdefault(userid, [0, {}])
+        if status == 1:
+            results[userid][0] = losses + count
+        elif status == 2:
+            wins[guesses] = wins.get(guesses, 0) + count
+        games += count
+
+    return results, games
+
+
+# Summarises the changes made by reverting the input results of a puzzle's games. (refer to get_puzzle_results)
+def summarise_results(results, games):
+    finished, wins, win_guesses = 0, 0, 0
+    for losses, user_wins in results.values():
+        finished += losses + sum(user_wins.values())
+        wins += sum(user_wins.values())
+        win_guesses += sum(guesses * count for guesses, count in user_wins.items())
+
+    return RevertSummary(games, sum(1 for losses, user_wins in results.values() if losses or user_wins), finished,
+                         wins, win_guesses)
+
+
+# Builds the statement removing a number of wins (bound as 'b_count') on a number of guesses from a user's statistics.
+def revert_wins_statement(guesses):
+    user = User.__table__
+    path = '$[{}]'.format(guesses - 1)
+    return user.update().where(user.c.userid == bindparam('b_userid'))\
+        .values(games_won=user.c.games_won - bindparam('b_count'),
+                game_guesses=func.json_set(user.c.game_guesses, path,
+                                           func.json_extract(user.c.game_guesses, path) - bindparam('b_count')))
+
+
+# Builds the statement removing a number of losses (bound as 'b_count') from a user's statistics.
+def revert_losses_statement():
+    user = User.__table__
+    return user.update().where(user.c.userid == bindparam('b_userid'))\
+        .values(games_lost=user.c.games_lost - bindparam('b_count'))
+
+
+# Reverts the statistics of the users of the input results, in one statement per status (and per number of guesses
+# for wins). (refer to get_puzzle_results)
+def revert_results(results):
+    losses = [{'b_userid': userid, 'b_count': user_losses} for userid, (user_losses, user_wins) in results.items()
+              if user_losses > 0]
+    if losses:
+        db.session.execute(revert_losses_statement(), losses)
+
+    wins = {}
+    for userid, (user_losses, user_wins) in results.items():
+        for guesses, count in user_wins.items():
+            wins.setdefault(guesses, []).append({'b_userid': userid, 'b_count': count})
+    for guesses, rows in sorted(wins.items()):
+        db.session.execute(revert_wins_statement(guesses), rows)
+
+
+# Deletes every game of a puzzle, a chunk of games at a time, reverting the statistics of their users and of the
+# puzzle, and then changes the puzzle's words.
+# Each chunk is committed along with the games it deleted, so an interrupted revert can be resumed by running it again.
+# A chunk's results are counted once its transaction has locked the database, so games that finished since the revert
+# began are reverted as they ended. Games started during the revert are deleted by a later chunk, and the words are
+# changed in the transaction that deletes the last game, so no game is left that was played against the old words.
+# The progress function, if given, is called with the number of games deleted and the total after every chunk.
+# Returns a summary of the reverted games.
+def revert_games(puzzle, update_words, total, chunk_size=revert_chunk_size, progress=None):
+    game_table = Game.__table__
+    summaries, userids = [], set()
+    while True:
+        gameids = [gameid for gameid, in db.session.query(Game.gameid).filter(Game.puzzleid == puzzle.puzzleid)
+                   .order_by(Game.gameid).limit(chunk_size)]
+
+        # Writing to the chunk's games begins the transaction and takes the database's write lock, so the games cannot
+        # change until the chunk is committed.
+        db.session.execute(game_table.update().where(game_table.c.gameid.in_(gameids))
+                           .values(status=game_table.c.status))
+
+        results, games = get_puzzle_results(puzzle.puzzleid, gameids)
+        revert_results(results)
+        summary = summarise_results(results, games)
+        stats.record_games(puzzle.puzzleid, -summary.finished, -summary.wins, -summary.win_guesses)
+        Game.query.filter(Game.gameid.in_(gameids)).delete(synchronize_session=False)
+
+        summaries.append(summary)
+        userids.update(userid for userid, (losses, wins) in results.items() if losses or wins)
+
+        # Updates the puzzle's WordIDs with the input word's IDs once no games are left.
+        last = Game.query.filter(Game.puzzleid == puzzle.puzzleid).first() is None
+        if last:
+            puzzle.wordid1 = update_words[0].wordid
+            puzzle.wordid2 = update_words[1].wordid
+            puzzle.wordid3 = update_words[2].wordid
+
+        db.session.commit()
+
+        deleted = sum(summary.games for summary in summaries)
+        if progress is not None:
+            progress(deleted, max(total, deleted))
+
+        if last:
+            totals = [sum(column) for column in zip(*summaries)]
+            return RevertSummary(totals[0], len(userids), totals[2], totals[3], totals[4])
+
 
 # Updates an input puzzle. If the puzzle has any games attached to it, these games are deleted and any user data
-# attached to these games is also reverted.
-def update_puzzle(puzzle, update_words):
-    # Grabs every game attached to the puzzle.
-    games = puzzle.games.all()
-    for game in games:
-        # If the game has ended, remove statistics that have been added to users.
-        if game.status > 0:
-            user = User.query.filter_by(userid=game.userid).first()
-            # If the game has been won, remove a win and guesses for the win.
-            if game.status == 2:
-                user_guesses = json.loads(user.game_guesses)
-                user_guesses[game.guesses - 1] -= 1
-                user.game_guesses = json.dumps(user_guesses)
-                user.games_won -= 1
-            # If the game has been lost, remove a loss.
-            elif game.status == 1:
-                user.games_lost -= 1
-
-        db.session.delete(game)
-
-    # Updates the puzzle's WordIDs with the input word's IDs.
-    puzzle.wordid1 = update_words[0].wordid
-    puzzle.wordid2 = update_words[1].wordid
-    puzzle.wordid3 = update_words[2].wordid
+# attached to these games is also reverted. (refer to revert_games)
+# Returns a summary of the reverted games. With dry_run, only the summary is returned and nothing is changed.
+def update_puzzle(puzzle, update_words, dry_run=False, chunk_size=revert_chunk_size, progress=None):
+    results, games = get_puzzle_results(puzzle.puzzleid)
+    summary = summarise_results(results, games)
+    if dry_run:
+        return summary
 
-    db.session.commit()
+    summary = revert_games(puzzle, update_words, games, chunk_size, progress)
+
+    # Removes the puzzle from the puzzle cache if it is the current day's puzzle, and any statistics including its
+    # games.
+    cache.daily_puzzle.invalidate(puzzle.puzzleid)
+    cache.population_statistics.invalidate()
+
+    return summary
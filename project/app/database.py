@@ -0,0 +1,41 @@
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+
+# Whether the effective pragmas have been logged yet.
+logged_pragmas = False
+
+
+# Runs the configured PRAGMA statements on every new SQLite connection.
+# The effective value of each pragma is logged for the first connection made.
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    global logged_pragmas
+
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas or not is_sqlite_connection(dbapi_connection):
+        return
+
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+    if not logged_pragmas:
+        logged_pragmas = True
+        settings = ", ".join('{}={}'.format(name, get_pragma(cursor, name)) for name in pragmas)
+        app.logger.info("SQLite connection settings: " + settings)
+
+    cursor.close()
+
+
+# Checks if a DBAPI connection is to SQLite, either directly or through the aiosqlite adapter of the async tier.
+def is_sqlite_connection(dbapi_connection):
+    return isinstance(dbapi_connection, sqlite3.Connection) or \
+        type(dbapi_connection).__name__ == 'AsyncAdapt_aiosqlite_connection'
+
+
+# Gets the effective value of a pragma on a connection's cursor.
+def get_pragma(cursor, name):
+    row = cursor.execute('PRAGMA {}'.format(name)).fetchone()
+    return row[0] if row is not None else None
@@ -0,0 +1,114 @@
+import contextvars
+import logging
+import sys
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+
+# The number of characters of the slowest statement that are logged.
+statement_length = 200
+
+# The debug log is shown regardless of whether the app is run in debug mode.
+if app.config['SQL_DEBUG_LOG']:
+    app.logger.setLevel(logging.DEBUG)
+
+
+# The queries made during a single request.
+class RequestQueries(object):
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.count = 0
+        self.time = 0.0
+        self.slowest_time = 0.0
+        self.slowest = None
+        # The number of queries and their total time for each function of the app that made them, only recorded when
+        # the debug log is enabled.
+        self.callers = {}
+
+    # Records a query made during the request.
+    def record(self, statement, duration, caller=None):
+        self.count += 1
+        self.time += duration
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest = statement
+
+        if caller is not None:
+            count, total = self.callers.get(caller, (0, 0.0))
+            self.callers[caller] = (count + 1, total + duration)
+
+
+# Gets the name of the innermost function of the app.api package that led to a query, such as "load.get_game".
+def get_caller():
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith('app.api.'):
+            return module[len('app.api.'):] + '.' + frame.f_code.co_name
+        frame = frame.f_back
+    return None
+
+
+# The queries of the current request of the async tier, which has no Flask request context. (refer to app/aio/routes.py)
+async_queries = contextvars.ContextVar('async_queries', default=None)
+
+
+# Gets the queries of the current request of either tier, or None outside of a request.
+def get_request_queries():
+    if has_request_context():
+        return g.get('queries')
+    return async_queries.get()
+
+
+# The start of each query is kept on its execution context rather than its connection, so a query that raises leaves
+# nothing behind for the queries after it.
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+# Records each query made during a request. Queries made outside of a request, such as by the game buffer, are ignored.
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_start', None)
+    if start is None:
+        return
+
+    duration = time.perf_counter() - start
+    queries = get_request_queries()
+    if queries is not None:
+        queries.record(statement, duration, get_caller() if app.config['SQL_DEBUG_LOG'] else None)
+
+
+@app.before_request
+def start_request_queries():
+    g.queries = RequestQueries()
+
+
+# Reports the queries of each request of the WSGI tier.
+@app.after_request
+def report_request_queries(response):
+    queries = g.get('queries')
+    if queries is not None:
+        report_queries(queries, response, request.method, request.path)
+    return response
+
+
+# Reports the queries of a request through the Server-Timing header, and the debug log if it is enabled.
+# Used by both tiers, as their responses share the same headers.
+def report_queries(queries, response, method, path):
+    total = (time.perf_counter() - queries.start) * 1000
+    if app.config['SERVER_TIMING']:
+        response.headers['Server-Timing'] = 'db;dur={:.2f};desc="{} queries", total;dur={:.2f}'.format(
+            queries.time * 1000, queries.count, total)
+
+    if app.config['SQL_DEBUG_LOG']:
+        callers = ", ".join("{} {}x {:.2f}ms".format(caller, count, duration * 1000) for caller, (count, duration)
+                            in sorted(queries.callers.items(), key=lambda item: item[1][1], reverse=True))
+        slowest = " ".join(queries.slowest.split())[:statement_length] if queries.slowest is not None else "-"
+        app.logger.debug("{} {} {}: {:.2f}ms, {} queries in {:.2f}ms [{}], slowest {:.2f}ms: {}".format(
+            method, path, response.status_code, total, queries.count, queries.time * 1000, callers,
+            queries.slowest_time * 1000, slowest))
@@ -0,0 +1,142 @@
+import threading
+import time
+from bisect import bisect_left
+from flask import g, request
+from app import app
+
+# Metrics of the app, exposed at /metrics in the Prometheus text format.
+# Each metric holds its own lock, so metrics can be updated by several threads at once.
+
+# The prefix of every metric name.
+namespace = 'wordtrinity'
+
+# The upper bounds of the latency histogram buckets, in seconds.
+latency_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+# Escapes a label value for the text format.
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Formats a set of label names and values, such as '{route="/api/game/guess"}'.
+def format_labels(names, values, extra=""):
+    labels = ['{}="{}"'.format(name, escape_label(value)) for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+# A counter, optionally with labels, that only increases.
+class Counter(object):
+    def __init__(self, name, description, labels=()):
+        self.name = namespace + '_' + name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        if len(self.labels) == 0:
+            self._values[()] = 0
+
+    # Increases the counter with the input label values by an amount.
+    def inc(self, *values, amount=1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    # Gets the value of the counter with the input label values.
+    def get(self, *values):
+        return self._values.get(values, 0)
+
+    # Returns the lines of the counter in the text format.
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+
+        lines = ["# HELP {} {}".format(self.name, self.description), "# TYPE {} counter".format(self.name)]
+        for labels, value in values:
+            lines.append("{}{} {}".format(self.name, format_labels(self.labels, labels), value))
+        return lines
+
+
+# A histogram of observed values, optionally with labels.
+# Observations are counted in the bucket they fall into, and the cumulative counts are only summed when rendered.
+class Histogram(object):
+    def __init__(self, name, description, labels=(), buckets=latency_buckets):
+        self.name = namespace + '_' + name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    # Records an observed value with the input label values.
+    def observe(self, value, *values):
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(values)
+            if entry is None:
+                # The counts of each bucket (and values above every bucket), and the sum of the values.
+                entry = self._values[values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bucket] += 1
+            entry[1] += value
+
+    # Gets the number of values observed with the input label values.
+    def count(self, *values):
+        entry = self._values.get(values)
+        return sum(entry[0]) if entry is not None else 0
+
+    # Returns the lines of the histogram in the text format.
+    def render(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+
+        lines = ["# HELP {} {}".format(self.name, self.description), "# TYPE {} histogram".format(self.name)]
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(self.name, format_labels(self.labels, labels,
+                                                                              'le="{}"'.format(bound)), cumulative))
+            lines.append("{}_sum{} {}".format(self.name, format_labels(self.labels, labels), total))
+            lines.append("{}_count{} {}".format(self.name, format_labels(self.labels, labels), cumulative))
+        return lines
+
+
+request_latency = Histogram('api_request_duration_seconds', "Latency of requests to the api routes.",
+                            ('method', 'route'))
+request_count = Counter('api_requests_total', "Requests to the api routes, by response status.",
+                        ('method', 'route', 'status'))
+guesses = Counter('guesses_total', "Guesses submitted, by outcome.", ('outcome',))
+users_created = Counter('users_created_total', "Users created.")
+puzzles_generated = Counter('puzzles_generated_total', "Puzzles generated on demand for the current day.")
+puzzles_prewarmed = Counter('puzzles_prewarmed_total', "Puzzles generated ahead of the day by prewarming.")
+
+# Every guess outcome is exposed, even before it has occurred.
+guess_outcomes = ('valid', 'invalid_word', 'wrong_length', 'win', 'loss')
+for outcome in guess_outcomes:
+    guesses.inc(outcome, amount=0)
+
+metrics = [request_latency, request_count, guesses, users_created, puzzles_generated, puzzles_prewarmed]
+
+
+# Returns every metric in the text format.
+def render():
+    return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+@app.before_request
+def start_request_timer():
+    if request.blueprint == 'api':
+        g.metrics_start = time.perf_counter()
+
+
+# Records the latency of each request to the api routes.
+@app.after_request
+def record_request_latency(response):
+    start = g.get('metrics_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_latency.observe(time.perf_counter() - start, request.method, route)
+        request_count.inc(request.method, route, str(response.status_code))
+
+    return response
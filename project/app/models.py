@@ -39,10 +39,23 @@ class Game(db.Model):
     userid = db.Column(db.String(32), db.ForeignKey('user.userid'))
     puzzleid = db.Column(db.Integer, db.ForeignKey('puzzle.puzzleid'))
     guesses = db.Column(db.Integer, default=0)
-    gpositions = db.Column(db.Text)
-    lpositions = db.Column(db.Text, default=json.dumps([0]*12))
+    # Both positions are packed into bytes, refer to app/api/positions.py for their format.
+    gpositions = db.Column(db.LargeBinary)
+    lpositions = db.Column(db.LargeBinary, default=bytes(12))
     status = db.Column(db.Integer, default=0)
 
+    # Covers the statistics queries, which count and sum the guesses of finished games by puzzle and status.
+    __table_args__ = (db.Index('ix_game_puzzleid_status', 'puzzleid', 'status', 'guesses'),)
+
     def __repr__(self):
         return '<Game {}>'.format(self.gameid)
 
+class Statistics(db.Model):
+    # The statistics of all puzzles are stored under a PuzzleID of 0.
+    puzzleid = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    games = db.Column(db.Integer, default=0)
+    wins = db.Column(db.Integer, default=0)
+    win_guesses = db.Column(db.Integer, default=0)
+
+    def __repr__(self):
+        return '<Statistics {}>'.format(self.puzzleid)
@@ -0,0 +1,134 @@
+import cProfile
+import itertools
+import os
+import pstats
+import random
+import threading
+import time
+from urllib.parse import quote, unquote
+from flask import g, request
+from app import app
+
+# Profiles a random fraction of requests (PROFILE_RATE) with cProfile, writing each profile to PROFILE_DIR.
+# Profiles are named after the time, route and process of the request, and only the newest PROFILE_KEEP are kept.
+# The profiles are merged into a report by route with "flask profile-report".
+
+# The extension of profile files.
+extension = '.prof'
+
+# Ensures profiles written at the same time have different names.
+_counter = itertools.count(1)
+_rotate_lock = threading.Lock()
+
+
+# Builds the name of a profile file for a route. The route is quoted, so it can be recovered from the name.
+def profile_name(method, route):
+    return "{:.6f}-{}-{}-{}-{}{}".format(time.time(), os.getpid(), next(_counter), method, quote(route, safe=''),
+                                         extension)
+
+
+# Gets the method and route of a profile file from its name.
+def parse_profile_name(name):
+    parts = name[:-len(extension)].split('-', 4)
+    return parts[3], unquote(parts[4])
+
+
+# Gets the names of every profile file in a directory, oldest first.
+def list_profiles(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted((name for name in os.listdir(directory) if name.endswith(extension)),
+                  key=lambda name: float(name.split('-', 1)[0]))
+
+
+# Removes the oldest profiles in a directory, keeping the newest "keep" profiles.
+def rotate_profiles(directory, keep):
+    with _rotate_lock:
+        names = list_profiles(directory)
+        for name in names[:max(0, len(names) - keep)]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+@app.before_request
+def start_profiler():
+    rate = app.config['PROFILE_RATE']
+    if rate <= 0 or random.random() >= rate:
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active.
+        return
+    g.profiler = profiler
+
+
+# Writes the profile of the request, if it was profiled.
+# Runs on teardown, so the profiler is also disabled when the request raises an error.
+@app.teardown_request
+def stop_profiler(exception=None):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+
+    profiler.disable()
+    directory = app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    profiler.dump_stats(os.path.join(directory, profile_name(request.method, route)))
+    rotate_profiles(directory, app.config['PROFILE_KEEP'])
+
+
+# Merges the profiles in a directory by route, optionally only those of routes containing the input text.
+# Returns a dictionary of (method, route) to the number of profiles and their merged pstats.Stats.
+def merge_profiles(directory, route_filter=None):
+    merged = {}
+    for name in list_profiles(directory):
+        key = parse_profile_name(name)
+        if route_filter and route_filter not in key[1]:
+            continue
+
+        path = os.path.join(directory, name)
+        try:
+            if key in merged:
+                merged[key][1].add(path)
+                merged[key][0] += 1
+            else:
+                merged[key] = [1, pstats.Stats(path)]
+        except (EOFError, OSError, ValueError):
+            # The profile was removed or is still being written.
+            continue
+
+    return {key: tuple(value) for key, value in merged.items()}
+
+
+# Gets the top "n" functions of merged profiles by cumulative time.
+# Returns a list of (function, calls, total time, cumulative time) tuples, with times in seconds.
+def top_functions(profile, n):
+    functions = []
+    for (filename, line, function), (primitive_calls, calls, total, cumulative, callers) in profile.stats.items():
+        if filename == '~':
+            name = function
+        else:
+            name = "{}:{}({})".format(shorten_path(filename), line, function)
+        functions.append((name, calls, total, cumulative))
+
+    functions.sort(key=lambda entry: entry[3], reverse=True)
+    return functions[:n]
+
+
+# Shortens the path of a source file, relative to the app for its own files and to the package for libraries.
+def shorten_path(path):
+    root = os.path.dirname(app.root_path)
+    if path.startswith(root + os.sep):
+        return os.path.relpath(path, root)
+
+    parts = path.split(os.sep)
+    if 'site-packages' in parts:
+        return os.sep.join(parts[parts.index('site-packages') + 1:])
+    return os.path.basename(path)
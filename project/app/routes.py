@@ -1,6 +1,6 @@
 from datetime import timedelta
-from flask import render_template, session
-from app import app, db
+from flask import render_template, session, Response
+from app import app, db, metrics
 from app.api import load
 
 
@@ -23,3 +23,9 @@ def index():
         session['gameid'] = 0
 
     return render_template('index.html')
+
+
+# Sets the route for the metrics of the app, in the Prometheus text format.
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
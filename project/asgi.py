@@ -0,0 +1,2 @@
+# The entry point of the asyncio-native tier, for an ASGI server such as "hypercorn asgi:app". (refer to app/aio)
+from app.aio import aio_app as app
@@ -1,4 +1,5 @@
 import os
+from sqlalchemy.pool import QueuePool
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -7,9 +8,63 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # The number of seconds that population statistics are cached for.
+    STATS_CACHE_TTL = int(os.environ.get('STATS_CACHE_TTL') or 30)
+    # The number of recently seen UserIDs kept in memory, and the number of UserIDs the Bloom filter of every UserID is
+    # first sized for. (refer to app/api/users.py)
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 100000)
+    USER_INDEX_CAPACITY = int(os.environ.get('USER_INDEX_CAPACITY') or 100000)
+    # Buffers the state of games in progress in memory, writing them to the database in batches.
+    # Only suited to running the app as a single process, as each process holds its own buffer.
+    GAME_WRITE_BEHIND = os.environ.get('GAME_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+    # The number of seconds between writes of the buffered games, and the number of buffered games that forces a write.
+    GAME_FLUSH_INTERVAL = float(os.environ.get('GAME_FLUSH_INTERVAL') or 1.0)
+    GAME_MAX_DIRTY = int(os.environ.get('GAME_MAX_DIRTY') or 1000)
+    # Prepares each day's puzzle and caches in the background, PUZZLE_PREWARM_LEAD seconds before the day begins.
+    # (refer to app/api/scheduler.py) The same may be done from a scheduled job with "flask prewarm".
+    PUZZLE_PREWARM = os.environ.get('PUZZLE_PREWARM', '').lower() in ('1', 'true', 'yes')
+    PUZZLE_PREWARM_LEAD = int(os.environ.get('PUZZLE_PREWARM_LEAD') or 600)
+    # The path of a catalog of every puzzle, built with "flask build-catalog", which new puzzles are picked from by
+    # their date instead of being generated. (refer to app/api/catalog.py) Puzzles are generated as before when unset.
+    PUZZLE_CATALOG = os.environ.get('PUZZLE_CATALOG')
+    # PRAGMA statements run on every new SQLite connection. (refer to app/database.py)
+    SQLITE_PRAGMAS = {}
+    # Reports the number and duration of each request's queries in a Server-Timing header.
+    # (refer to app/instrumentation.py)
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', '1').lower() in ('1', 'true', 'yes')
+    # Logs the queries of each request at the debug level, including the functions that made them and the slowest query.
+    SQL_DEBUG_LOG = os.environ.get('SQL_DEBUG_LOG', '').lower() in ('1', 'true', 'yes')
+    # The fraction of requests profiled with cProfile, from 0 (disabled) to 1. (refer to app/profiling.py)
+    # Profiles are written to PROFILE_DIR, keeping only the newest PROFILE_KEEP profiles.
+    PROFILE_RATE = float(os.environ.get('PROFILE_RATE') or 0)
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(basedir, 'profiles')
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP') or 500)
 
 class TestConfig(Config):
     SECRET_KEY = os.environ.get('SECRET_KEY') or '187d9b2b33da0efd45cbb12a32aa5ad1'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
                               'sqlite:///' + os.path.join(basedir, 'tests/test.db')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# A profile for serving many players at once from a SQLite database.
+# Select it by setting APP_CONFIG=config.ProductionConfig.
+class ProductionConfig(Config):
+    # Write-ahead logging lets guesses be read while another is written, with synchronous=NORMAL only syncing at
+    # checkpoints. Writers wait up to busy_timeout milliseconds for the lock rather than failing with
+    # "database is locked". A negative cache_size is in KiB.
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL',
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 10000),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE') or -32000),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE') or 268435456),
+        'temp_store': 'MEMORY',
+    }
+    # Connections (and their pragmas and page caches) are pooled between requests rather than reopened for each one.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': QueuePool,
+        'pool_size': int(os.environ.get('DATABASE_POOL_SIZE') or 10),
+        'max_overflow': int(os.environ.get('DATABASE_MAX_OVERFLOW') or 10),
+        'pool_timeout': 30,
+        'connect_args': {'check_same_thread': False, 'timeout': 30},
+    }
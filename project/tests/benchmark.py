@@ -0,0 +1,319 @@
+import argparse, itertools, json, os, platform, random, statistics, sys, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+from app import app, db
+from app.models import Game
+from app.api import load, game, words, cache, dictionary, scoring, positions
+from config import Config, ProductionConfig
+
+# A suite of microbenchmarks for the functions on the guess path and puzzle generation, run against a temporary
+# database seeded with the word lists. Results can be saved as a baseline, which later runs are compared against.
+# Baselines hold absolute timings, so they are saved locally (and ignored by git) along with the host and interpreter
+# they were timed on, and are only compared against runs on the same host and interpreter.
+# Run with "python -m tests.benchmark" (refer to the README for its options).
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+default_baseline = os.path.join(basedir, 'benchmarks.json')
+
+# The registered benchmarks, in order, as (name, setup, number) tuples.
+# Each setup is a context manager yielding the function that is timed, with "number" calls timed per repeat.
+benchmarks = []
+
+
+# Registers a benchmark, timed over "number" calls of the function yielded by the decorated setup.
+def benchmark(name, number):
+    def register(setup):
+        benchmarks.append((name, contextmanager(setup), number))
+        return setup
+    return register
+
+
+# Creates a temporary SQLite database populated with the word lists, returning its path.
+def setup_database():
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    db.create_all()
+    words.populate_database()
+    cache.daily_puzzle.invalidate()
+    cache.population_statistics.invalidate()
+    dictionary.index.invalidate()
+
+    return path
+
+
+# Removes the temporary database, along with any write-ahead log.
+def teardown_database(path):
+    db.session.remove()
+    db.drop_all()
+    db.get_engine().dispose()
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+# Switches the SQLite pragmas and pool settings to those of a config profile.
+# Takes effect for the next database that is set up.
+def use_profile(profile):
+    app.config['SQLITE_PRAGMAS'] = profile.SQLITE_PRAGMAS
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = getattr(profile, 'SQLALCHEMY_ENGINE_OPTIONS', {})
+
+
+# Creates "n" seeded random turns of guessed answer words, as (guesses, answers) pairs of word triples.
+def random_turns(n, seed=0):
+    rng = random.Random(seed)
+    answers = [word.wordname for word in dictionary.index.get_answers()]
+    return [(tuple(rng.choice(answers) for i in range(3)), tuple(rng.choice(answers) for i in range(3)))
+            for num in range(0, n)]
+
+
+# Scoring of a turn, as done by check_guess, bypassing the cache of scored turns.
+@benchmark('score_turn', 10000)
+def bench_score_turn():
+    turns = itertools.cycle(random_turns(1000))
+    score_turn = scoring.score_turn.__wrapped__
+    yield lambda: score_turn(*next(turns))
+
+
+# Scoring of 1000 turns at once.
+@benchmark('score_batch_1000', 20)
+def bench_score_batch():
+    guesses, answers = zip(*random_turns(1000))
+    guesses, answers = scoring.encode_words(guesses), scoring.encode_words(answers)
+    yield lambda: scoring.score_batch(guesses, answers)
+
+
+# A full guess request through the test client, which never ends the game.
+@benchmark('check_guess', 500)
+def bench_check_guess():
+    guess_limit = game.guess_limit
+    game.guess_limit = sys.maxsize
+
+    client = app.test_client()
+    client.get('/')
+    client.put('/api/load/game')
+    turns = itertools.cycle(random_turns(100))
+
+    def guess():
+        word = next(turns)[0][0]
+        client.post('/api/game/guess', json=[word, 'None', 'None'])
+
+    try:
+        yield guess
+    finally:
+        game.guess_limit = guess_limit
+
+
+# Updating the letter positions of a game with the result of a turn.
+@benchmark('get_letter_pos', 20000)
+def bench_get_letter_pos():
+    results = itertools.cycle([scoring.score_turn.__wrapped__(*turn)[1] for turn in random_turns(1000)])
+    current_game = Game(lpositions=positions.new_letter_positions())
+    yield lambda: game.get_letter_pos(current_game, next(results))
+
+
+# Updating the guess positions of a game with the result of a turn, against the current puzzle.
+@benchmark('get_guess_pos', 20000)
+def bench_get_guess_pos():
+    answers = load.get_puzzle_words()
+    turns = [(turn[0], scoring.score_turn.__wrapped__(turn[0], answers)[0]) for turn in random_turns(1000)]
+    turns = itertools.cycle(turns)
+    current_game = Game(gpositions=positions.new_guess_positions(len(load.get_unique_letters())))
+    yield lambda: game.get_guess_pos(current_game, *reversed(next(turns)))
+
+
+# Getting the letters of the current puzzle.
+@benchmark('get_letters', 50000)
+def bench_get_letters():
+    load.get_letters()
+    yield load.get_letters
+
+
+# Getting the unique letters of the current puzzle.
+@benchmark('get_unique_letters', 50000)
+def bench_get_unique_letters():
+    load.get_unique_letters()
+    yield load.get_unique_letters
+
+
+# Generating a puzzle for a day, once the dictionary is loaded.
+@benchmark('generate_puzzle', 200)
+def bench_generate_puzzle():
+    dictionary.index.get_lists()
+    days = (date(2022, 1, 1) + timedelta(days=num) for num in itertools.count())
+    yield lambda: words.generate_puzzle(next(days))
+
+
+# Generating and inserting 30 days of new puzzles.
+@benchmark('generate_puzzles_30', 5)
+def bench_generate_puzzles():
+    starts = (date(2030, 1, 1) + timedelta(days=num * 30) for num in itertools.count())
+    yield lambda: words.generate_puzzles(next(starts), 30)
+
+
+# Replacing the words in the database with the word lists.
+@benchmark('populate_database', 1)
+def bench_populate_database():
+    yield words.populate_database
+
+
+# Runs a benchmark "repeat" times, returning the time per call in seconds of each repeat.
+def run_benchmark(setup, number, repeat):
+    times = []
+    with setup() as function:
+        # The first call is untimed, so that every repeat starts warm.
+        function()
+        for num in range(0, repeat):
+            start = time.perf_counter()
+            for call in range(0, number):
+                function()
+            times.append((time.perf_counter() - start) / number)
+
+    return times
+
+
+# Runs every benchmark whose name contains one of the input names (or all of them) on a new temporary database.
+# Returns a dictionary of the fastest and median time per call of each benchmark, in microseconds.
+def run_suite(names=None, repeat=5):
+    results = {}
+    random.seed(0)
+
+    path = setup_database()
+    try:
+        for name, setup, number in benchmarks:
+            if names and not any(part in name for part in names):
+                continue
+
+            times = run_benchmark(setup, number, repeat)
+            results[name] = {'best_us': round(min(times) * 1e6, 2),
+                             'median_us': round(statistics.median(times) * 1e6, 2),
+                             'number': number, 'repeat': repeat}
+            print("{:<22} {:>12.2f}us {:>12.2f}us".format(name, results[name]['best_us'],
+                                                          results[name]['median_us']))
+    finally:
+        teardown_database(path)
+
+    return results
+
+
+# Gets the host and interpreter that benchmarks are timed on, which a baseline is only valid for.
+def get_environment():
+    return {'host': platform.node(), 'machine': platform.machine(),
+            'python': "{} {}".format(platform.python_implementation(), platform.python_version())}
+
+
+# Compares results against a baseline, printing the change in the fastest time of each benchmark.
+# Returns the names of the benchmarks that are slower than the baseline by more than the threshold. (a fraction)
+def compare(results, baseline, threshold):
+    regressions = []
+    print("\n{:<22} {:>12} {:>12} {:>9}".format("benchmark", "baseline", "current", "change"))
+
+    for name, result in results.items():
+        if name not in baseline:
+            print("{:<22} {:>12} {:>11.2f}us {:>9}".format(name, "-", result['best_us'], "new"))
+            continue
+
+        before = baseline[name]['best_us']
+        change = result['best_us'] / before - 1
+        flag = ""
+        if change > threshold:
+            flag = " REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = " improved"
+
+        print("{:<22} {:>11.2f}us {:>11.2f}us {:>+8.1f}%{}".format(name, before, result['best_us'], change * 100,
+                                                                  flag))
+
+    return regressions
+
+
+# Times "players" games of four guesses each, played by "threads" threads at once through the test client.
+def bench_concurrent_guesses(players, threads):
+    answers = list(load.get_puzzle_words())
+
+    def play(num):
+        client = app.test_client()
+        client.get('/')
+        client.put('/api/load/game')
+
+        failed = 0
+        for guesses in (['crane', 'None', 'None'], ['None', 'slate', 'None'], ['None', 'None', 'pious'], answers):
+            failed += client.post('/api/game/guess', json=guesses).status_code != 200
+        return failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        failed = sum(executor.map(play, range(0, players)))
+    elapsed = time.perf_counter() - start
+
+    return players * 4 / elapsed, failed
+
+
+# Compares the guess throughput of the default profile against the production profile, each on a new database.
+def bench_profiles(players=200, threads=8):
+    for name, profile in (('default', Config), ('production', ProductionConfig)):
+        use_profile(profile)
+        path = setup_database()
+        try:
+            throughput, failed = bench_concurrent_guesses(players, threads)
+        finally:
+            teardown_database(path)
+
+        print("{} profile: {} guesses from {} threads, {:.0f} guesses/s, {} failed".format(
+            name, players * 4, threads, throughput, failed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times the hot-path functions, comparing them against a baseline.")
+    parser.add_argument('names', nargs='*', help="only run benchmarks whose names contain one of these")
+    parser.add_argument('--repeat', type=int, default=5, help="the number of times each benchmark is repeated")
+    parser.add_argument('--baseline', default=default_baseline, help="the file holding the baseline results")
+    parser.add_argument('--save', action='store_true', help="save the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="the fractional slowdown reported as a regression")
+    parser.add_argument('--profiles', action='store_true',
+                        help="also compare the guess throughput of the SQLite profiles")
+    args = parser.parse_args()
+
+    print("{:<22} {:>14} {:>14}".format("benchmark", "best", "median"))
+    results = run_suite(args.names, args.repeat)
+
+    regressions = []
+    if args.save:
+        # Saved results are merged into the baseline, so a subset of the benchmarks can be saved.
+        # A baseline of another host or interpreter is replaced rather than merged.
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        if baseline.get('environment') != get_environment():
+            baseline = {}
+
+        baseline.setdefault('benchmarks', {}).update(results)
+        baseline['environment'] = get_environment()
+        baseline['saved'] = str(date.today())
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+            file.write('\n')
+        print("\nSaved the results to " + args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+        if baseline.get('environment') == get_environment():
+            regressions = compare(results, baseline['benchmarks'], args.threshold)
+        else:
+            print("\nThe baseline was not saved on this host and interpreter, so it is not compared against. Save a "
+                  "baseline for them with --save.")
+
+    if args.profiles:
+        print()
+        bench_profiles()
+
+    if regressions:
+        print("\n{} benchmark(s) regressed: {}".format(len(regressions), ", ".join(regressions)))
+        sys.exit(1)
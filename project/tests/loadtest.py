@@ -0,0 +1,290 @@
+import argparse, json, os, random, re, socket, string, subprocess, sys, threading, time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import build_opener, HTTPCookieProcessor, Request
+from app import app
+from app.api import words
+from config import Config, ProductionConfig
+
+# Simulates virtual players going through the flow of a game: loading the page and their game, making several guesses
+# (some of which are invalid) and then viewing their statistics.
+# Run with "python -m tests.loadtest" to test in-process against a temporary database, or with "--url" to test a
+# running server.
+
+# The routes requested by each player, in the order they are reported.
+routes = ['GET /', 'PUT /api/load/game', 'POST /api/game/guess', 'GET /api/stats/game']
+
+# The UserID is read from the index page, as the front-end does.
+userid_pattern = re.compile(r'user_id = "(\w+)"')
+
+# The project directory, which the servers of each tier are run from.
+project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The commands that serve each tier of the app on a port.
+tier_commands = {
+    'wsgi': lambda port: [sys.executable, '-m', 'flask', 'run', '--with-threads', '--port', str(port)],
+    'asgi': lambda port: [sys.executable, '-m', 'hypercorn', 'asgi:app', '--bind', '127.0.0.1:' + str(port)],
+}
+
+
+# A player's session with the app through the Flask test client.
+class ClientSession(object):
+    def __init__(self):
+        self.client = app.test_client()
+
+    # Sends a request, returning its status code and body.
+    def request(self, method, path, data=None, params=None):
+        response = self.client.open(path, method=method, json=data, query_string=params)
+        return response.status_code, response.get_data()
+
+
+# A player's session with a running server, keeping its session cookie between requests.
+class HTTPSession(object):
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+
+    # Sends a request, returning its status code and body.
+    def request(self, method, path, data=None, params=None):
+        url = self.base_url + path
+        if params:
+            url += '?' + urlencode(params)
+
+        body = json.dumps(data).encode() if data is not None else None
+        request = Request(url, data=body, method=method, headers={'Content-Type': 'application/json'})
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                return response.status, response.read()
+        except HTTPError as error:
+            return error.code, error.read()
+
+
+# The latencies, errors and guess outcomes recorded over a load test.
+class Results(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.outcomes = defaultdict(int)
+        self.elapsed = 0
+
+    # Records a request to a route, along with whether it failed.
+    def record(self, route, latency, failed):
+        with self._lock:
+            self.latencies[route].append(latency)
+            if failed:
+                self.errors[route] += 1
+
+    # Records the outcome of a guess.
+    def record_outcome(self, outcome):
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    # Gets the total number of requests and of failed requests.
+    def totals(self):
+        return sum(len(latencies) for latencies in self.latencies.values()), sum(self.errors.values())
+
+    # Returns a report of the throughput, and the latency and error rate of each route.
+    def report(self):
+        requests, errors = self.totals()
+        lines = ["{} requests in {:.2f}s ({:.0f} requests/s), {} failed ({:.2f}%)".format(
+            requests, self.elapsed, requests / self.elapsed if self.elapsed else 0, errors,
+            errors / requests * 100 if requests else 0)]
+
+        lines.append("{:<22} {:>8} {:>8} {:>9} {:>9} {:>9} {:>9}".format(
+            "route", "requests", "errors", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+        for route in routes:
+            latencies = sorted(self.latencies[route])
+            if len(latencies) == 0:
+                continue
+            lines.append("{:<22} {:>8} {:>7.2f}% {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                route, len(latencies), self.errors[route] / len(latencies) * 100,
+                percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000,
+                percentile(latencies, 99) * 1000, latencies[-1] * 1000))
+
+        lines.append("guesses: " + ", ".join("{} {}".format(count, outcome)
+                                             for outcome, count in sorted(self.outcomes.items())))
+        return "\n".join(lines)
+
+
+# Gets a percentile of a sorted list of values, using the nearest rank.
+def percentile(values, percent):
+    if len(values) == 0:
+        return 0
+    rank = -(-len(values) * percent // 100)
+    return values[max(0, int(rank) - 1)]
+
+
+# A virtual player, which plays a single game through a session.
+# Guesses are drawn from the input words, with some replaced by invalid words or words of the wrong length.
+class Player(object):
+    def __init__(self, session, results, rng, guess_words, guesses=5, invalid_rate=0.2):
+        self.session = session
+        self.results = results
+        self.rng = rng
+        self.guess_words = guess_words
+        self.guesses = guesses
+        self.invalid_rate = invalid_rate
+
+    # Sends a request to a route and records its latency, returning its status code and body.
+    # A request fails if it raises an error or responds with an error status.
+    def request(self, route, data=None, params=None):
+        method, path = route.split(' ')
+        start = time.perf_counter()
+        try:
+            status, body = self.session.request(method, path, data, params)
+        except Exception:
+            status, body = None, b''
+
+        self.results.record(route, time.perf_counter() - start, status is None or status >= 400)
+        return status, body
+
+    # Gets the next word to be guessed.
+    def next_word(self):
+        if self.rng.random() >= self.invalid_rate:
+            return self.rng.choice(self.guess_words)
+
+        length = self.rng.choice([3, 4, 5, 5, 6])
+        return "".join(self.rng.choice(string.ascii_lowercase) for num in range(0, length))
+
+    def play(self):
+        status, body = self.request('GET /')
+        match = userid_pattern.search(body.decode(errors='replace'))
+        if status != 200 or match is None:
+            return
+
+        status, body = self.request('PUT /api/load/game')
+        if status != 200:
+            return
+
+        # Each guess fills one of the three words, so the game only ends once it is won or the guess limit is reached.
+        for turn in range(0, self.guesses):
+            guesses = ["None"] * 3
+            guesses[turn % 3] = self.next_word()
+            status, body = self.request('POST /api/game/guess', guesses)
+            if status != 200:
+                continue
+
+            payload = json.loads(body)
+            if not payload['success']:
+                self.results.record_outcome('invalid')
+            elif payload['status'] == 0:
+                self.results.record_outcome('valid')
+            else:
+                self.results.record_outcome('won' if payload['status'] == 2 else 'lost')
+                break
+
+        self.request('GET /api/stats/game', params={'userid': match.group(1), 'type': self.rng.choice(['user',
+                                                                                                   'population'])})
+
+
+# Reads the words that players guess from the word lists.
+def read_guess_words():
+    return [row['wordname'] for wordlist in ('app/api/words/word-answers.txt', 'app/api/words/word-guesses.txt')
+            for row in words.read_wordlist(wordlist, False)]
+
+
+# Runs "players" virtual players across "threads" threads, with each player given a new session from the factory.
+# Returns the recorded results.
+def run(session_factory, players, threads, guesses=5, invalid_rate=0.2, seed=0):
+    results = Results()
+    guess_words = read_guess_words()
+
+    def play(num):
+        rng = random.Random(seed * 1000003 + num)
+        Player(session_factory(), results, rng, guess_words, guesses, invalid_rate).play()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        # Iterating the results raises any error from a player.
+        list(executor.map(play, range(0, players)))
+    results.elapsed = time.perf_counter() - start
+
+    return results
+
+
+# Gets a free local port.
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# Starts a server for a tier of the app using a database, returning its process once it accepts connections.
+def start_server(tier, database, port, timeout=30):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + database)
+    process = subprocess.Popen(tier_commands[tier](port), cwd=project_dir, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The {} server exited with status {}.".format(tier, process.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError("The {} server did not start within {} seconds.".format(tier, timeout))
+
+
+# Runs the load test against a single process of each tier (the threaded WSGI server and the ASGI server), each with
+# a new database. Returns a dictionary of each tier to its results.
+def compare_tiers(players, threads, guesses=5, invalid_rate=0.2, seed=0):
+    from tests.benchmark import setup_database, teardown_database
+
+    tiers = {}
+    for tier in tier_commands:
+        path = setup_database()
+        port = free_port()
+        process = start_server(tier, path, port)
+        try:
+            tiers[tier] = run(lambda: HTTPSession('http://127.0.0.1:' + str(port)), players, threads, guesses,
+                              invalid_rate, seed)
+        finally:
+            process.terminate()
+            process.wait()
+            teardown_database(path)
+
+    return tiers
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulates virtual players to test the game API under load.")
+    parser.add_argument('--players', type=int, default=1000, help="the number of virtual players")
+    parser.add_argument('--threads', type=int, default=16, help="the number of players playing at once")
+    parser.add_argument('--guesses', type=int, default=5, help="the number of guesses made by each player")
+    parser.add_argument('--invalid-rate', type=float, default=0.2, help="the fraction of guesses that are invalid")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', help="the address of a running server, instead of testing in-process")
+    parser.add_argument('--profile', choices=['default', 'production'], default='default',
+                        help="the database profile used when testing in-process")
+    parser.add_argument('--compare-tiers', action='store_true',
+                        help="compare a server of the WSGI tier with a server of the ASGI tier")
+    args = parser.parse_args()
+
+    if args.compare_tiers:
+        tiers = compare_tiers(args.players, args.threads, args.guesses, args.invalid_rate, args.seed)
+        for tier, results in tiers.items():
+            print("\n{} tier:\n{}".format(tier.upper(), results.report()))
+        sys.exit(0)
+
+    if args.url:
+        results = run(lambda: HTTPSession(args.url), args.players, args.threads, args.guesses, args.invalid_rate,
+                      args.seed)
+    else:
+        from tests.benchmark import setup_database, teardown_database, use_profile
+
+        use_profile(ProductionConfig if args.profile == 'production' else Config)
+        path = setup_database()
+        try:
+            results = run(ClientSession, args.players, args.threads, args.guesses, args.invalid_rate, args.seed)
+        finally:
+            teardown_database(path)
+
+    print(results.report())
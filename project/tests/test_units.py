@@ -1,9 +1,33 @@
-from flask import json
-import unittest, os, uuid
-from datetime import date, timedelta
-from app import app, db
-from app.models import User, Word, Puzzle, Game
-from app.api import load, words, stats
+from flask import json, g
+import unittest, os, sys, uuid, tempfile, asyncio, random
+from unittest import mock
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from app import app, db, metrics, profiling, instrumentation
+from config import ProductionConfig
+from app.models import User, Word, Puzzle, Game, Statistics
+from app.api import load, words, stats, cache, dictionary, scoring, positions, buffer, users, scheduler, catalog
+from tests import loadtest
+
+# The async tier is optional, as it depends on Quart and aiosqlite.
+try:
+    from app.aio import aio_app, api as aio_api
+    from app.aio.database import dispose_engines
+except ImportError:
+    aio_app = None
+
+
+# Clears the process-wide caches, indexes and buffered games, so that no test sees the state of the tests before it.
+def reset_process_state():
+    cache.daily_puzzle.invalidate()
+    cache.population_statistics.invalidate()
+    dictionary.index.invalidate()
+    users.index.invalidate()
+    catalog.index.invalidate()
+    buffer.games.clear()
 
 
 # Tests database functionality, in particular with puzzle generation, users and statistics.
@@ -16,6 +40,7 @@ class PuzzleModelCase(unittest.TestCase):
             'sqlite:///' + os.path.join(basedir, 'test.db')
         db.create_all()
         db.session.commit()
+        reset_process_state()
 
     # Destroys the database at the end of each test function.
     def tearDown(self):
@@ -79,6 +104,9 @@ class PuzzleModelCase(unittest.TestCase):
         user2.games_lost += 1
         db.session.commit()
 
+        # The games were inserted directly, so the statistics are rebuilt from them.
+        stats.rebuild_statistics()
+
         # Generates statistics for both puzzles.
         win_rate1, average_guesses1 = stats.get_puzzle_statistics('population')
         win_rate2, average_guesses2 = stats.get_puzzle_statistics('user')
@@ -119,5 +147,935 @@ class PuzzleModelCase(unittest.TestCase):
         # Tests if the total amount of puzzles is equivalent to 7.
         self.assertEqual(7, len(Puzzle.query.all()))
 
+    # Tests if the current day's puzzle is cached, replaced on a new day and invalidated when it is updated.
+    def test_puzzle_cache(self):
+        words.populate_database()
+        words.generate_puzzles(date.today(), 2)
+
+        today = load.get_daily_puzzle()
+        self.assertIs(today, load.get_daily_puzzle())
+        self.assertEqual(Puzzle.query.filter_by(date=date.today()).first().puzzleid, today.puzzleid)
+        self.assertEqual(load.get_puzzle_words(today.puzzleid), list(today.words))
+        self.assertEqual(12, len(today.letters))
+        self.assertEqual(list(today.letters), [today.unique_letters[index] for index in today.letter_indexes])
+
+        # A different day replaces the cached puzzle.
+        tomorrow = cache.daily_puzzle.get(load.load_daily_puzzle, date.today() + timedelta(days=1))
+        self.assertNotEqual(today.puzzleid, tomorrow.puzzleid)
+        today = load.get_daily_puzzle()
+
+        # Updating the current puzzle removes it from the cache.
+        puzzle = Puzzle.query.get(today.puzzleid)
+        update_words = [Word.query.filter_by(wordname=word).first() for word in tomorrow.words]
+        words.update_puzzle(puzzle, update_words)
+        self.assertEqual(list(tomorrow.words), load.get_puzzle_words())
+
+    # Tests if updating a puzzle reverts the statistics of its games in chunks of users, or only counts them in a dry run.
+    def test_update_puzzle_revert(self):
+        words.populate_database()
+        words.generate_puzzles(date.today(), 2)
+        puzzle1, puzzle2 = Puzzle.query.order_by(Puzzle.date).all()
+
+        # Each user wins, loses or leaves unfinished a game of each puzzle.
+        for num in range(0, 12):
+            user = User(userid=str(num), games_won=0, games_lost=0)
+            user_guesses = [0] * 10
+            for puzzle in (puzzle1, puzzle2):
+                game = Game(userid=user.userid, puzzleid=puzzle.puzzleid, status=num % 3, guesses=num % 10 + 1)
+                db.session.add(game)
+                if game.status == 2:
+                    user.games_won += 1
+                    user_guesses[game.guesses - 1] += 1
+                elif game.status == 1:
+                    user.games_lost += 1
+            user.game_guesses = json.dumps(user_guesses)
+            db.session.add(user)
+        db.session.commit()
+        stats.rebuild_statistics()
+
+        update_words = [Word.query.get(puzzle2.wordid1), Word.query.get(puzzle2.wordid2),
+                        Word.query.get(puzzle2.wordid3)]
+        summary = words.update_puzzle(puzzle1, update_words, dry_run=True)
+        self.assertEqual(words.RevertSummary(12, 8, 8, 4, 3 + 6 + 9 + 2), summary)
+        self.assertEqual(24, Game.query.count())
+
+        # After the first chunk, another player starts and wins a game and an unfinished game is lost.
+        progress = []
+        def play(deleted, games):
+            if len(progress) == 0:
+                db.session.add(User(userid='late', games_won=1, games_lost=0,
+                                    game_guesses=json.dumps([0, 0, 0, 1, 0, 0, 0, 0, 0, 0])))
+                db.session.add(Game(userid='late', puzzleid=puzzle1.puzzleid, status=2, guesses=4))
+                game = Game.query.filter_by(puzzleid=puzzle1.puzzleid, status=0).order_by(Game.gameid.desc()).first()
+                game.status = 1
+                User.query.filter_by(userid=game.userid).first().games_lost += 1
+                stats.record_games(puzzle1.puzzleid, 2, 1, 4)
+                db.session.commit()
+            progress.append((deleted, games))
+
+        self.assertEqual(words.RevertSummary(13, 10, 10, 5, 24),
+                         words.update_puzzle(puzzle1, update_words, chunk_size=5, progress=play))
+        self.assertEqual([(5, 12), (10, 12), (13, 13)], progress)
+        self.assertEqual(12, Game.query.count())
+        self.assertEqual(update_words[0].wordid, Puzzle.query.get(puzzle1.puzzleid).wordid1)
+
+        # Only the games of the other puzzle remain counted, by the users and the statistics.
+        self.assertEqual([], stats.rebuild_statistics(commit=False))
+        for user in User.query.all():
+            games = Game.query.filter_by(userid=user.userid).all()
+            self.assertEqual(sum(game.status == 2 for game in games), user.games_won)
+            self.assertEqual(sum(game.status == 1 for game in games), user.games_lost)
+            self.assertEqual([sum(game.status == 2 and game.guesses == guesses for game in games)
+                              for guesses in range(1, 11)], json.loads(user.game_guesses))
+
+    # Tests if a range of puzzles is viewed in two queries, including days without a puzzle, in each format.
+    def test_view_puzzles(self):
+        words.populate_database()
+        words.generate_puzzles(date.today() + timedelta(days=1), 2)
+        dictionary.index.invalidate()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            views = list(words.view_puzzles(date.today(), 4))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(2, len(statements))
+
+        puzzles = Puzzle.query.order_by(Puzzle.date).all()
+        self.assertEqual([None, puzzles[0].puzzleid, puzzles[1].puzzleid, None], [view.puzzleid for view in views])
+        self.assertEqual(words.get_puzzle_data(puzzles[0]), next(words.format_puzzle_views(views[1:2])))
+        self.assertEqual(list(load.get_puzzle_words(None, words.generate_puzzle(date.today()))), list(views[0].words))
+
+        lines = list(words.format_puzzle_views(views, 'csv'))
+        self.assertEqual(5, len(lines))
+        self.assertEqual(',' + str(date.today()) + ',' + ','.join(views[0].words), lines[1])
+
+        rows = json.loads("\n".join(words.format_puzzle_views(views, 'json')))
+        self.assertEqual([str(view.date) for view in views], [row['date'] for row in rows])
+        self.assertEqual([], json.loads("".join(words.format_puzzle_views([], 'json'))))
+
+    # Tests if the catalog holds every puzzle of the answer words and puzzles are picked from it only while it is used.
+    def test_catalog(self):
+        words.populate_database()
+        lists = dictionary.index.get_lists()
+        generated = words.generate_puzzle(date.today())
+
+        handle, path = tempfile.mkstemp(suffix='.catalog')
+        os.close(handle)
+        try:
+            puzzles = catalog.build_catalog(path, lists)
+            self.assertEqual(len(list(catalog.enumerate_puzzles(lists))), len(puzzles))
+            self.assertLess(catalog.count_distinct(puzzles), len(puzzles))
+            self.assertEqual(3, catalog.count_distinct(np.array([[1, 2, 3], [2, 3, 1], [3, 1, 2], [1, 1, 2], [1, 2, 1],
+                                                                   [4, 4, 4]], dtype='<u2')))
+
+            app.config['PUZZLE_CATALOG'] = path
+            catalog.index.invalidate()
+            puzzle = words.generate_puzzle(date.today())
+            self.assertIn([puzzle.wordid1, puzzle.wordid2, puzzle.wordid3], puzzles.tolist())
+            self.assertEqual((puzzle.wordid1, puzzle.wordid2, puzzle.wordid3), catalog.Catalog(path).pick(date.today()))
+
+            # Each puzzle's words connect.
+            names = load.get_puzzle_words(None, puzzle)
+            self.assertEqual([names[1][0], names[2][0], names[0][0]], [names[0][-1], names[1][-1], names[2][-1]])
+
+            # A catalog of different answer words is not used.
+            with open(path, 'r+b') as file:
+                file.seek(12)
+                file.write(bytes(32))
+            catalog.index.invalidate()
+            puzzle = words.generate_puzzle(date.today())
+            self.assertEqual((generated.wordid1, generated.wordid2, generated.wordid3),
+                             (puzzle.wordid1, puzzle.wordid2, puzzle.wordid3))
+        finally:
+            app.config['PUZZLE_CATALOG'] = None
+            catalog.index.invalidate()
+            os.remove(path)
+
+    # Tests if the next day's puzzles are generated ahead of time and its puzzle replaces the cached one without a query.
+    def test_prewarm(self):
+        words.populate_database()
+        today, tomorrow = date.today(), date.today() + timedelta(days=1)
+
+        generated, prewarmed = metrics.puzzles_generated.get(), metrics.puzzles_prewarmed.get()
+        count, puzzle = scheduler.prewarm(today)
+        self.assertEqual(8, Puzzle.query.count())
+        self.assertEqual(7, count)
+
+        # Only the current day's puzzle, which had not been prewarmed, counts as generated on demand.
+        self.assertEqual((generated + 1, prewarmed + 7), (metrics.puzzles_generated.get(),
+                                                          metrics.puzzles_prewarmed.get()))
+        self.assertEqual(0, scheduler.prewarm(today)[0])
+        self.assertEqual(today, cache.daily_puzzle.peek(today).day)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            self.assertIs(cache.daily_puzzle.peek_next(tomorrow), cache.daily_puzzle.get(load.load_daily_puzzle,
+                                                                                        tomorrow))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual([], statements)
+        self.assertEqual(Puzzle.query.filter_by(date=tomorrow).first().puzzleid, puzzle.puzzleid)
+
+        # Updating the preloaded puzzle removes it from the cache.
+        cache.daily_puzzle.invalidate(puzzle.puzzleid)
+        self.assertIsNone(cache.daily_puzzle.peek(tomorrow))
+
+        self.assertEqual(datetime(2022, 5, 1, 23, 50), scheduler.next_run(datetime(2022, 5, 1, 12), 600))
+        self.assertEqual(datetime(2022, 5, 2, 23, 50), scheduler.next_run(datetime(2022, 5, 1, 23, 55), 600))
+
+    # Tests if the background threads are started once by the first request, rather than when the app is imported.
+    def test_background_threads(self):
+        package = sys.modules['app']
+        self.assertIn(package.start_background_threads, app.before_first_request_funcs)
+
+        with mock.patch.object(package, '_background_started', False), \
+                mock.patch.dict(app.config, GAME_WRITE_BEHIND=True, PUZZLE_PREWARM=True), \
+                mock.patch.object(buffer.games, 'start') as buffer_start, \
+                mock.patch.object(scheduler.scheduler, 'start') as scheduler_start:
+            package.start_background_threads()
+            package.start_background_threads()
+        buffer_start.assert_called_once_with(app, app.config['GAME_FLUSH_INTERVAL'], app.config['GAME_MAX_DIRTY'])
+        scheduler_start.assert_called_once_with(app, app.config['PUZZLE_PREWARM_LEAD'])
+
+    # Tests if the dictionary validates words without the database and is reloaded after the words are populated.
+    def test_dictionary(self):
+        # An empty Word table is not cached.
+        self.assertFalse(dictionary.index.contains('crane'))
+
+        count = words.populate_database()
+        self.assertEqual(count, len(dictionary.index))
+        self.assertTrue(dictionary.index.contains('crane'))
+        self.assertTrue(dictionary.index.is_answer('crane'))
+        self.assertTrue(dictionary.index.contains('aahed'))
+        self.assertFalse(dictionary.index.is_answer('aahed'))
+        self.assertFalse(dictionary.index.contains('aaaaa'))
+        self.assertFalse(dictionary.index.is_answer('aaaaa'))
+
+        # Words removed from the database remain valid until the dictionary is reloaded by a population.
+        Word.query.filter_by(wordname='crane').delete()
+        db.session.commit()
+        self.assertTrue(dictionary.index.contains('crane'))
+        words.populate_database()
+        self.assertTrue(dictionary.index.contains('crane'))
+        self.assertEqual(count, len(dictionary.index))
+
+    # Tests if puzzles generated from the dictionary are unchanged from those generated by querying the database.
+    def test_generate_puzzle(self):
+        words.populate_database()
+
+        # WordIDs of puzzles generated by the database queries for each date.
+        expected = {date(2022, 5, 1): [1544, 1618, 675],
+                    date(2022, 6, 15): [1632, 2312, 1003],
+                    date(2023, 1, 1): [644, 2311, 938]}
+
+        for day, wordids in expected.items():
+            puzzle = words.generate_puzzle(day)
+            self.assertEqual(wordids, [puzzle.wordid1, puzzle.wordid2, puzzle.wordid3])
+
+            # The connecting letters of each word must match.
+            puzzle_words = load.get_puzzle_words(None, puzzle)
+            for num in range(0, 3):
+                self.assertEqual(puzzle_words[num][-1], puzzle_words[(num + 1) % 3][0])
+
+    # Tests if puzzles are only generated for days without a puzzle and can be generated from several threads.
+    def test_generate_puzzles(self):
+        words.populate_database()
+
+        self.assertEqual(30, words.generate_puzzles(date.today(), 30))
+        self.assertEqual(30, words.generate_puzzles(date.today() + timedelta(days=15), 45))
+        self.assertEqual(0, words.generate_puzzles(date.today(), 60))
+        self.assertEqual(60, Puzzle.query.count())
+
+        # Puzzles generated across threads match those generated in order.
+        days = [date.today() + timedelta(days=num) for num in range(0, 60)]
+        with ThreadPoolExecutor(4) as executor:
+            puzzles = list(executor.map(words.generate_puzzle, days))
+
+        for puzzle in puzzles:
+            stored = Puzzle.query.filter_by(date=puzzle.date).first()
+            self.assertEqual([stored.wordid1, stored.wordid2, stored.wordid3],
+                             [puzzle.wordid1, puzzle.wordid2, puzzle.wordid3])
+
+
+# Tests requests made to the game's API through a test client.
+class GameRequestCase(unittest.TestCase):
+
+    # The greatest number of queries a guess may make once the puzzle and dictionary are loaded.
+    guess_query_budget = 4
+
+    # Sets up the database and a client with a loaded game at the start of each test function.
+    def setUp(self):
+        basedir = os.path.abspath(os.path.dirname(__file__))
+        app.config['SQLALCHEMY_DATABASE_URI'] = \
+            'sqlite:///' + os.path.join(basedir, 'test.db')
+        db.create_all()
+        db.session.commit()
+        reset_process_state()
+        words.populate_database()
+
+        self.client = app.test_client()
+        self.client.get('/')
+        self.client.put('/api/load/game')
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.count_statement)
+
+    # Destroys the database at the end of each test function.
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count_statement)
+        db.session.remove()
+        db.drop_all()
+
+    # Records every statement executed on the database.
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    # Submits a guess, returning the JSON response and the number of statements it executed.
+    def guess(self, guesses):
+        self.statements.clear()
+        response = self.client.post('/api/game/guess', json=guesses)
+        return response.get_json(), len(self.statements)
+
+    # Tests if guesses stay within the query budget, including the guess that wins the game.
+    def test_guess_query_budget(self):
+        answers = load.get_puzzle_words()
+
+        response, count = self.guess(['crane', 'None', 'None'])
+        self.assertEqual(0, response['status'])
+
+        response, count = self.guess(['slate', 'None', 'None'])
+        self.assertEqual(0, response['status'])
+        self.assertLessEqual(count, self.guess_query_budget)
+
+        response, count = self.guess(['aaaaa', 'None', 'None'])
+        self.assertFalse(response['success'])
+        self.assertLessEqual(count, self.guess_query_budget)
+
+        response, count = self.guess(answers)
+        self.assertEqual(2, response['status'])
+        self.assertLessEqual(count, self.guess_query_budget)
+
+        user = User.query.first()
+        self.assertEqual(1, user.games_won)
+        self.assertEqual([0, 0, 1, 0, 0, 0, 0, 0, 0, 0], json.loads(user.game_guesses))
+
+    # Tests if the packed positions of a game are updated by guesses and loaded as JSON lists.
+    def test_game_positions(self):
+        answers = load.get_puzzle_words()
+        unique_letters = load.get_unique_letters()
+        self.guess([answers[0], 'None', 'None'])
+
+        game = Game.query.first()
+        self.assertEqual(12 * len(unique_letters), len(game.gpositions))
+        self.assertEqual(answers[0][1:] + '0' * 7, positions.letter_positions_to_string(game.lpositions)[1:])
+
+        data = self.client.put('/api/load/game').get_json()
+        gpositions = json.loads(data['gpositions'])
+        lpositions = json.loads(data['lpositions'])
+        self.assertEqual(1, data['guessCount'])
+        self.assertEqual(12, len(gpositions))
+        self.assertEqual(list(answers[0][1:]) + [0] * 7, lpositions[1:])
+
+        # Each correctly placed letter of the first word has a state of 4 in its slot.
+        for slot in range(0, 5):
+            self.assertEqual(4, gpositions[slot][unique_letters.index(answers[0][slot])])
+        self.assertEqual([[0] * len(unique_letters)] * 6, gpositions[5:11])
+
+    # Tests if guesses in progress are buffered and written in batches, while finished games are committed immediately.
+    def test_write_behind(self):
+        app.config['GAME_WRITE_BEHIND'] = True
+        try:
+            response, count = self.guess(['crane', 'None', 'None'])
+            self.assertEqual(0, response['status'])
+            self.assertEqual(1, count)
+            self.assertEqual(1, len(buffer.games))
+
+            # The buffered state is loaded, but not yet written.
+            self.assertEqual(0, Game.query.first().guesses)
+            self.assertEqual(1, self.client.put('/api/load/game').get_json()['guessCount'])
+            db.session.remove()
+
+            self.assertEqual(1, buffer.games.flush())
+            self.assertEqual(1, Game.query.first().guesses)
+            db.session.remove()
+
+            # The winning guess is committed with the buffered state, which is then discarded.
+            self.guess(['slate', 'None', 'None'])
+            response, count = self.guess(load.get_puzzle_words())
+            self.assertEqual(2, response['status'])
+            self.assertEqual(0, len(buffer.games))
+
+            game = Game.query.first()
+            self.assertEqual((3, 2), (game.guesses, game.status))
+            answers = load.get_puzzle_words()
+            self.assertEqual(answers[0] + answers[1][1:] + answers[2][1:4],
+                             positions.letter_positions_to_string(game.lpositions))
+            self.assertEqual(0, buffer.games.flush())
+        finally:
+            app.config['GAME_WRITE_BEHIND'] = False
+
+    # Tests if a buffered state is never restored into or written over a new game that reuses a deleted game's GameID.
+    def test_write_behind_reused_gameid(self):
+        app.config['GAME_WRITE_BEHIND'] = True
+        try:
+            self.guess(['crane', 'slate', 'None'])
+            gameid = Game.query.first().gameid
+
+            # The game is deleted by another process, and the next game created is given its GameID.
+            db.session.execute(Game.__table__.delete())
+            db.session.commit()
+            client = app.test_client()
+            client.get('/')
+            self.assertEqual(0, client.put('/api/load/game').get_json()['guessCount'])
+            self.assertEqual(gameid, Game.query.first().gameid)
+            db.session.remove()
+
+            buffer.games.flush()
+            self.assertEqual(0, Game.query.first().guesses)
+        finally:
+            app.config['GAME_WRITE_BEHIND'] = False
+
+    # Tests if the cached puzzle is replaced once the puzzle is found to have been updated by another process.
+    def test_puzzle_updated_elsewhere(self):
+        stale = cache.daily_puzzle.peek()
+        tomorrow = Puzzle.query.filter_by(date=date.today() + timedelta(days=1)).first()
+        new_wordids = (tomorrow.wordid1, tomorrow.wordid2, tomorrow.wordid3)
+        new_words = load.get_puzzle_words(tomorrow.puzzleid)
+
+        # The words are changed without clearing this process's cache, while keeping the game.
+        puzzle = Puzzle.query.get(stale.puzzleid)
+        puzzle.wordid1, puzzle.wordid2, puzzle.wordid3 = new_wordids
+        db.session.commit()
+        response, count = self.guess(new_words)
+        self.assertEqual(2, response['status'])
+        self.assertEqual(tuple(new_words), cache.daily_puzzle.peek().words)
+
+        # The words are changed back by an update, which deletes the games, while the outdated puzzle stays cached.
+        words.update_puzzle(Puzzle.query.get(stale.puzzleid), [Word.query.filter_by(wordname=word).first()
+                                                               for word in stale.words])
+        cache.daily_puzzle.get(lambda day: cache.DailyPuzzle(day, stale.puzzleid, new_words, new_wordids))
+        data = self.client.put('/api/load/game').get_json()
+        self.assertEqual(list(stale.letters), json.loads(data['letters']))
+        self.assertEqual(12 * len(stale.unique_letters), len(Game.query.first().gpositions))
+
+    # Tests if a batch of turns reports the game's buffered state when its writes are buffered.
+    def test_batch_guesses_write_behind(self):
+        app.config['GAME_WRITE_BEHIND'] = True
+        try:
+            response = self.client.post('/api/game/guesses', json=[['crane', 'None', 'None'],
+                                                                    ['slate', 'None', 'None']]).get_json()
+            self.assertEqual((0, 2), (response['status'], response['guessCount']))
+            self.assertEqual(0, Game.query.first().guesses)
+            self.assertEqual(2, self.client.put('/api/load/game').get_json()['guessCount'])
+            db.session.remove()
+
+            self.assertEqual(1, buffer.games.flush())
+            self.assertEqual(2, Game.query.first().guesses)
+            self.assertEqual(0, buffer.games.flush())
+        finally:
+            app.config['GAME_WRITE_BEHIND'] = False
+
+    # Tests if the statistics are kept up to date by finished games and updated puzzles, without drifting.
+    def test_statistics(self):
+        self.guess(load.get_puzzle_words())
+
+        # A second user loses the current puzzle.
+        client = app.test_client()
+        client.get('/')
+        client.put('/api/load/game')
+        client.post('/api/game/guess', json=['crane', 'slate', 'crane'])
+
+        self.assertEqual((50, 1), stats.get_puzzle_statistics('population'))
+        self.assertEqual((50, 1), stats.get_puzzle_statistics('user'))
+        self.assertEqual([], stats.rebuild_statistics(commit=False))
+
+        # Updating the puzzle removes its games from the statistics.
+        puzzle = Puzzle.query.get(load.get_current_puzzleid())
+        words.update_puzzle(puzzle, [Word.query.get(puzzle.wordid1), Word.query.get(puzzle.wordid2),
+                                     Word.query.get(puzzle.wordid3)])
+        self.assertEqual((0, 0), stats.get_puzzle_statistics('user'))
+        self.assertEqual([], stats.rebuild_statistics(commit=False))
+
+        # Drift is found and rebuilt.
+        stats.record_games(puzzle.puzzleid, 1, 1, 5)
+        db.session.commit()
+        self.assertEqual([(0, (1, 1, 5), (0, 0, 0)), (puzzle.puzzleid, (1, 1, 5), (0, 0, 0))],
+                         stats.rebuild_statistics())
+        self.assertEqual([], stats.rebuild_statistics(commit=False))
+
+    # Computes the win rate and average guesses per win of the games as they were computed in Python, before the
+    # statistics were aggregated in SQL.
+    def python_statistics(self, games):
+        total_games, total_wins, total_guesses = 0, 0, 0
+        for game in games:
+            if game.status > 0:
+                total_games += 1
+
+            if game.status == 2:
+                total_wins += 1
+                total_guesses += game.guesses
+
+        win_rate, average_guesses = 0, 0
+        if total_games != 0:
+            win_rate = int(stats.round_value((total_wins/total_games) * 100, 0))
+
+        if total_wins != 0:
+            average_guesses = int(stats.round_value(total_guesses/total_wins, 0))
+
+        return win_rate, average_guesses
+
+    # Tests if the statistics aggregated in SQL match the statistics computed in Python, including their rounding.
+    def test_statistics_aggregation(self):
+        with self.client.session_transaction() as session:
+            userid = session['userid']
+        puzzleid = load.get_current_puzzleid()
+        other_puzzleid = Puzzle.query.filter(Puzzle.puzzleid != puzzleid).first().puzzleid
+
+        # A win rate of 2/3 (66.67%) and an average of 3.5 guesses per win on the current puzzle, alongside a game in
+        # progress and a win on another puzzle.
+        for game_puzzleid, status, guesses in [(puzzleid, 2, 3), (puzzleid, 2, 4), (puzzleid, 1, 12),
+                                               (puzzleid, 0, 2), (other_puzzleid, 2, 6)]:
+            user = User(userid=uuid.uuid4().hex)
+            db.session.add(user)
+            db.session.add(Game(userid=user.userid, puzzleid=game_puzzleid, status=status, guesses=guesses))
+        db.session.commit()
+        stats.rebuild_statistics()
+
+        population = self.python_statistics(Game.query.filter_by(puzzleid=puzzleid).all())
+        overall = self.python_statistics(Game.query.all())
+        self.assertEqual((67, 4), population)
+        self.assertEqual((75, 4), overall)
+        self.assertEqual(population, stats.get_puzzle_statistics('population'))
+        self.assertEqual(overall, stats.get_puzzle_statistics('user'))
+
+        for dtype, expected in [('population', population), ('user', overall)]:
+            data = self.client.get('/api/stats/game', query_string={'userid': userid, 'type': dtype}).get_json()
+            self.assertEqual(expected, (data['winrate'], data['averageGuesses']))
+
+    # Tests if population statistics are cached while user statistics are not, and unchanged statistics are not resent.
+    def test_statistics_request(self):
+        with self.client.session_transaction() as session:
+            userid = session['userid']
+        url = '/api/stats/game?type=population&userid=' + userid
+
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('private, no-cache', response.headers['Cache-Control'])
+        etag = response.headers['ETag']
+
+        # Revalidating unchanged statistics returns a 304 response.
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_code)
+
+        # The win updates the user's statistics straight away, but the cached population statistics only once
+        # the cache is cleared.
+        self.guess(load.get_puzzle_words())
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(100, response.get_json()['userwinrate'])
+        self.assertEqual(0, response.get_json()['winrate'])
+
+        cache.population_statistics.invalidate()
+        self.assertEqual(100, self.client.get(url).get_json()['winrate'])
+
+    # Tests if known users are found without a query, and users created elsewhere or not existing are found correctly.
+    def test_user_index(self):
+        self.statements.clear()
+        self.client.get('/')
+        self.assertFalse(any('FROM user' in statement for statement in self.statements))
+
+        # A user inserted without the index, as another process would, is found by catching up with new users.
+        userid = str(uuid.uuid4()).replace("-", "")
+        self.assertFalse(load.is_valid_user(userid))
+        db.session.add(User(userid=userid))
+        db.session.commit()
+        self.assertTrue(load.is_valid_user(userid))
+
+        self.statements.clear()
+        self.assertTrue(load.is_valid_user(userid))
+        self.assertEqual([], self.statements)
+        self.assertFalse(load.is_valid_user('notauser'))
+
+        # UserIDs that are not strings are rejected as unknown users.
+        for userid in ('null', '123', '["a"]', '{"a": 1}'):
+            response = self.client.put('/api/load/changeuser', data=userid, content_type='application/json')
+            self.assertEqual(200, response.status_code)
+            self.assertEqual("This UserID is currently not linked to any account.", response.get_json()['message'])
+
+        bloom = users.BloomFilter(1000)
+        for num in range(0, 1000):
+            bloom.add(str(num))
+        self.assertTrue(all(str(num) in bloom for num in range(0, 1000)))
+        self.assertLess(sum(str(num) in bloom for num in range(1000, 11000)), 50)
+
+    # Tests if a batch of turns gives the same results as submitting each turn separately, in a single transaction.
+    def test_batch_guesses(self):
+        answers = load.get_puzzle_words()
+        turns = [['crane', 'None', 'None'], ['qqqqq', 'None', 'None'], ['cran', 'None', 'None'],
+                 [answers[0], 'None', answers[2]], answers, ['slate', 'None', 'None']]
+
+        # Another player submits each turn separately.
+        client = app.test_client()
+        client.get('/')
+        client.put('/api/load/game')
+        expected = [client.post('/api/game/guess', json=guesses).get_json() for guesses in turns]
+
+        self.statements.clear()
+        response = self.client.post('/api/game/guesses', json=turns).get_json()
+        self.assertTrue(response['success'])
+        self.assertEqual(expected, response['results'])
+        self.assertEqual(2, response['status'])
+        self.assertEqual(3, response['guessCount'])
+        self.assertLessEqual(len(self.statements), self.guess_query_budget + 1)
+        self.assertEqual(1, sum(statement.startswith('UPDATE game') for statement in self.statements))
+
+        # Both players have the same game and statistics.
+        games = Game.query.order_by(Game.gameid).all()
+        self.assertEqual([(3, 2, games[0].gpositions, games[0].lpositions)] * 2,
+                         [(game.guesses, game.status, game.gpositions, game.lpositions) for game in games])
+        self.assertEqual(2, User.query.filter_by(games_won=1).count())
+        self.assertEqual(2, Statistics.query.get(stats.all_puzzles).wins)
+
+        # Turns after the game ended are not played.
+        response = self.client.post('/api/game/guesses', json=[['crane', 'None', 'None']]).get_json()
+        self.assertEqual([{"success": False, "message": "The game has already ended."}], response['results'])
+
+    # Tests if invalid batches of turns are rejected.
+    def test_batch_guesses_invalid(self):
+        for turns in ([], ['crane', 'None', 'None'], [['crane', 'None']], [[1, 2, 3]], None,
+                      [['crane', 'None', 'None']] * 51):
+            response = self.client.post('/api/game/guesses', json=turns)
+            self.assertEqual(400, response.status_code)
+
+        self.assertEqual(0, Game.query.first().guesses)
+
+    # Tests if the queries of a request are reported in its Server-Timing header.
+    def test_server_timing(self):
+        self.statements.clear()
+        response = self.client.post('/api/game/guess', json=['crane', 'None', 'None'])
+
+        timing = response.headers['Server-Timing']
+        self.assertIn('desc="{} queries"'.format(len(self.statements)), timing)
+        self.assertTrue(timing.startswith('db;dur='))
+        self.assertIn(', total;dur=', timing)
+
+    # Tests if queries that raise leave nothing on their connection, so the queries after them are timed on their own.
+    def test_failed_query_timing(self):
+        with app.test_request_context(), db.engine.connect() as connection:
+            g.queries = instrumentation.RequestQueries()
+            for _ in range(0, 3):
+                with self.assertRaises(exc.OperationalError):
+                    connection.exec_driver_sql('SELECT * FROM missing')
+            connection.exec_driver_sql('SELECT 1')
+
+            self.assertEqual((1, 'SELECT 1'), (g.queries.count, g.queries.slowest))
+            self.assertNotIn('query_start', connection.info)
+
+    # Tests if guesses are counted by outcome and the latency of each request is exposed in the metrics.
+    def test_metrics(self):
+        answers = load.get_puzzle_words()
+        before = {outcome: metrics.guesses.get(outcome) for outcome in metrics.guess_outcomes}
+        requests = metrics.request_latency.count('POST', '/api/game/guess')
+
+        self.guess(['cran', 'None', 'None'])
+        self.guess(['qqqqq', 'None', 'None'])
+        self.guess(['crane', 'None', 'None'])
+        self.guess(answers)
+
+        changes = {outcome: metrics.guesses.get(outcome) - before[outcome] for outcome in metrics.guess_outcomes}
+        self.assertEqual({'valid': 1, 'invalid_word': 1, 'wrong_length': 1, 'win': 1, 'loss': 0}, changes)
+        self.assertEqual(requests + 4, metrics.request_latency.count('POST', '/api/game/guess'))
+
+        response = self.client.get('/metrics')
+        self.assertEqual(200, response.status_code)
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE wordtrinity_api_request_duration_seconds histogram', text)
+        self.assertIn('wordtrinity_api_request_duration_seconds_count{method="POST",route="/api/game/guess"} '
+                      + str(requests + 4), text)
+        self.assertIn('wordtrinity_api_request_duration_seconds_bucket{method="POST",route="/api/game/guess",'
+                      'le="+Inf"} ' + str(requests + 4), text)
+        self.assertIn('wordtrinity_guesses_total{outcome="win"} ' + str(metrics.guesses.get('win')), text)
+        self.assertIn('wordtrinity_users_created_total ' + str(metrics.users_created.get()), text)
+        self.assertIn('wordtrinity_puzzles_generated_total ' + str(metrics.puzzles_generated.get()), text)
+        self.assertGreaterEqual(metrics.puzzles_generated.get(), 7)
+
+    # Tests if sampled requests are profiled by route, keeping only the newest profiles.
+    def test_profiling(self):
+        directory = tempfile.mkdtemp()
+        config = {key: app.config[key] for key in ('PROFILE_RATE', 'PROFILE_DIR', 'PROFILE_KEEP')}
+        app.config.update(PROFILE_RATE=1, PROFILE_DIR=directory, PROFILE_KEEP=3)
+        try:
+            self.guess(['crane', 'None', 'None'])
+            self.guess(['slate', 'None', 'None'])
+            self.client.put('/api/load/game')
+            self.client.put('/api/load/game')
+
+            self.assertEqual(3, len(profiling.list_profiles(directory)))
+            profiles = profiling.merge_profiles(directory)
+            self.assertEqual({('POST', '/api/game/guess'), ('PUT', '/api/load/game')}, set(profiles))
+            self.assertEqual(1, profiles[('POST', '/api/game/guess')][0])
+            self.assertEqual(2, profiles[('PUT', '/api/load/game')][0])
+
+            functions = [name for name, calls, total, cumulative
+                         in profiling.top_functions(profiles[('POST', '/api/game/guess')][1], 50)]
+            self.assertTrue(any(name.endswith('(check_guess)') for name in functions))
+
+            # A request whose error is propagated, skipping the after request hooks, is still profiled and its
+            # profiler is disabled.
+            with mock.patch('app.api.load.get_game_context', side_effect=RuntimeError), \
+                    mock.patch.dict(app.config, PROPAGATE_EXCEPTIONS=True):
+                with self.assertRaises(RuntimeError):
+                    self.client.post('/api/game/guess', json=['crane', 'None', 'None'])
+            self.assertIsNone(sys.getprofile())
+            self.assertEqual(('POST', '/api/game/guess'),
+                             profiling.parse_profile_name(profiling.list_profiles(directory)[-1]))
+        finally:
+            app.config.update(config)
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+
+    # Tests if virtual players of the load test complete every route without errors.
+    def test_load_test(self):
+        results = loadtest.run(loadtest.ClientSession, players=20, threads=4, guesses=4)
+
+        requests, errors = results.totals()
+        self.assertEqual(20 * 7, requests)
+        self.assertEqual(0, errors)
+        self.assertEqual(20 * 4, sum(results.outcomes.values()))
+        self.assertEqual(20, len(results.latencies['GET /api/stats/game']))
+        self.assertEqual(3, loadtest.percentile([1, 2, 3, 4], 75))
+
+
+# Tests the production SQLite profile, on a temporary database so that the test database keeps its journal mode.
+class SQLiteProfileCase(unittest.TestCase):
+
+    # Sets up a temporary database using the production profile's pragmas and pool at the start of each test function.
+    def setUp(self):
+        self.config = {key: app.config.get(key) for key in ('SQLITE_PRAGMAS', 'SQLALCHEMY_ENGINE_OPTIONS')}
+        app.config['SQLITE_PRAGMAS'] = ProductionConfig.SQLITE_PRAGMAS
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS
+
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + self.path
+        db.create_all()
+        reset_process_state()
+        words.populate_database()
+
+    # Destroys the database and restores the previous profile at the end of each test function.
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.get_engine().dispose()
+        app.config.update(self.config)
+
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    # Tests if the pragmas are applied to every pooled connection.
+    def test_pragmas(self):
+        with db.engine.connect() as connection:
+            self.assertEqual('wal', connection.exec_driver_sql('PRAGMA journal_mode').scalar())
+            self.assertEqual(1, connection.exec_driver_sql('PRAGMA synchronous').scalar())
+            self.assertEqual(ProductionConfig.SQLITE_PRAGMAS['busy_timeout'],
+                             connection.exec_driver_sql('PRAGMA busy_timeout').scalar())
+
+    # Tests if several players can guess at the same time without any of their requests failing.
+    def test_concurrent_guesses(self):
+        answers = load.get_puzzle_words()
+
+        def play(num):
+            client = app.test_client()
+            client.get('/')
+            client.put('/api/load/game')
+
+            codes = [client.post('/api/game/guess', json=['crane', 'None', 'None']).status_code
+                     for turn in range(0, 3)]
+            codes.append(client.post('/api/game/guess', json=answers).status_code)
+            return codes
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(play, range(0, 16)))
+
+        self.assertEqual([[200] * 4] * 16, results)
+        self.assertEqual(16, Game.query.filter_by(status=2).count())
+
+
+# Tests the async tier against the WSGI tier.
+@unittest.skipIf(aio_app is None, "The async tier requires Quart and aiosqlite.")
+class AsyncTierCase(unittest.TestCase):
+
+    # Sets up the database at the start of each test function.
+    def setUp(self):
+        basedir = os.path.abspath(os.path.dirname(__file__))
+        app.config['SQLALCHEMY_DATABASE_URI'] = \
+            'sqlite:///' + os.path.join(basedir, 'test.db')
+        db.create_all()
+        db.session.commit()
+        reset_process_state()
+        words.populate_database()
+
+    # Destroys the database at the end of each test function.
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    # The requests of a game, which end in a win.
+    def requests(self):
+        answers = load.get_puzzle_words()
+        return [('PUT', '/api/load/game', None), ('POST', '/api/game/guess', ['crane', 'None', 'None']),
+                ('POST', '/api/game/guess', ['cran', 'None', 'None']),
+                ('POST', '/api/game/guess', ['qqqqq', 'None', 'None']),
+                ('POST', '/api/game/guess', [answers[0], 'None', answers[2]]), ('PUT', '/api/load/game', None),
+                ('POST', '/api/game/guesses', [['slate', 'None', 'None'], ['qqqqq', 'None', 'None']]),
+                ('POST', '/api/game/guesses', [['crane'], ['None']]),
+                ('POST', '/api/game/guesses', [answers, ['crane', 'None', 'None']]),
+                ('POST', '/api/game/guess', answers)]
+
+    # Tests if the async tier gives the same responses as the WSGI tier to players making the same requests.
+    def test_same_responses(self):
+        client = app.test_client()
+        client.get('/')
+        expected = []
+        for method, path, data in self.requests():
+            response = client.open(path, method=method, json=data)
+            expected.append((response.status_code, response.get_json()))
+
+        async def play():
+            client = aio_app.test_client()
+            await client.get('/')
+            responses = []
+            for method, path, data in self.requests():
+                response = await client.open(path, method=method, json=data)
+                responses.append((response.status_code, await response.get_json()))
+            await dispose_engines()
+            return responses
+
+        self.assertEqual(expected, asyncio.run(play()))
+        self.assertEqual(2, User.query.filter_by(games_won=1).count())
+        self.assertEqual((2, 2), (Statistics.query.get(stats.all_puzzles).games,
+                                  Statistics.query.get(stats.all_puzzles).wins))
+
+    # Tests if the async tier gives the same responses as the WSGI tier when the writes of games are buffered.
+    def test_same_responses_write_behind(self):
+        app.config['GAME_WRITE_BEHIND'] = True
+        try:
+            self.test_same_responses()
+        finally:
+            app.config['GAME_WRITE_BEHIND'] = False
+
+    # Tests if the async tier checks UserIDs through the index of UserIDs, so unknown UserIDs are not looked up.
+    def test_user_index(self):
+        userid = uuid.uuid4().hex
+        db.session.add(User(userid=userid))
+        db.session.commit()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            self.assertFalse(asyncio.run(aio_api.is_valid_user(uuid.uuid4().hex)))
+            self.assertTrue(asyncio.run(aio_api.is_valid_user(userid)))
+            self.assertFalse(asyncio.run(aio_api.is_valid_user(None)))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(1, sum('WHERE user.userid' in statement for statement in statements))
+        self.assertTrue(users.index.is_known(userid))
+
+    # Tests if the queries of a request of the async tier are reported in its Server-Timing header.
+    def test_server_timing(self):
+        statements = []
+
+        async def request():
+            client = aio_app.test_client()
+            await client.get('/')
+            await client.put('/api/load/game')
+            listener = lambda *args: statements.append(args[2])
+            event.listen(Engine, 'before_cursor_execute', listener)
+            try:
+                response = await client.post('/api/game/guess', json=['crane', 'None', 'None'])
+            finally:
+                event.remove(Engine, 'before_cursor_execute', listener)
+            await dispose_engines()
+            return response.headers['Server-Timing']
+
+        timing = asyncio.run(request())
+        self.assertGreater(len(statements), 0)
+        self.assertTrue(timing.startswith('db;dur='))
+        self.assertIn('desc="{} queries"'.format(len(statements)), timing)
+        self.assertIn(', total;dur=', timing)
+
+    # Tests if the statistics route of the async tier matches the WSGI tier, including conditional requests.
+    def test_statistics(self):
+        client = app.test_client()
+        client.get('/')
+        userid = User.query.first().userid
+        query = {'userid': userid, 'type': 'population'}
+        expected = client.get('/api/stats/game', query_string=query)
+
+        async def request():
+            client = aio_app.test_client()
+            response = await client.get('/api/stats/game', query_string=query)
+            cached = await client.get('/api/stats/game', query_string=query,
+                                      headers={'If-None-Match': response.headers['ETag']})
+            invalid = await client.get('/api/stats/game', query_string={'userid': 'none', 'type': 'user'})
+            await dispose_engines()
+            return response, await response.get_json(), cached.status_code, invalid.status_code
+
+        response, data, cached_status, invalid_status = asyncio.run(request())
+        self.assertEqual(expected.get_json(), data)
+        self.assertEqual(expected.headers['ETag'], response.headers['ETag'])
+        self.assertEqual(304, cached_status)
+        self.assertEqual(400, invalid_status)
+
+# Tests the scoring of guesses, independently of the database.
+class ScoringCase(unittest.TestCase):
+
+    # Tests if guesses are scored with the expected letter states.
+    def test_score_turn(self):
+        answers = ('brink', 'knelt', 'throb')
+
+        data, lpositions = scoring.score_turn(('crane', 'None', 'slate'), answers)
+        self.assertEqual(((1, 4, 1, 4, 1), "None", (1, 1, 1, 3, 1)), data)
+        self.assertEqual('0r0n0' + '00000' + '00000', lpositions)
+
+        # Repeated letters beyond those in the answer are blank, from the back of the word, unless another word has the
+        # letter at that position.
+        data, lpositions = scoring.score_turn(('bbbbb', 'kkkkk', 'None'), answers)
+        self.assertEqual(((4, 1, 1, 1, 2), (4, 1, 1, 1, 2), "None"), data)
+        self.assertEqual('b0000' + 'k0000' + '00000', lpositions)
+
+        data, lpositions = scoring.score_turn(('None', 'None', 'knelt'), answers)
+        self.assertEqual(("None", "None", (2, 2, 2, 2, 3)), data)
+
+        data, lpositions = scoring.score_turn(answers, answers)
+        self.assertEqual(((4,) * 5,) * 3, data)
+        self.assertEqual('brinkkneltthrob', lpositions)
+
+    # Tests if the batch scoring matches the scoring of each individual turn.
+    def test_score_batch(self):
+        rng = random.Random(0)
+        guesses, answers = [], []
+        for num in range(0, 2000):
+            letters = rng.choice(['abc', 'abcdefghijklmnopqrstuvwxyz'])
+            answers.append(tuple("".join(rng.choice(letters) for i in range(5)) for j in range(3)))
+            guesses.append(tuple("None" if rng.random() < 0.2 else "".join(rng.choice(letters) for i in range(5))
+                                 for j in range(3)))
+
+        states = scoring.score_batch(guesses, answers)
+        self.assertEqual((2000, 3, 5), states.shape)
+
+        for num in range(0, 2000):
+            data, lpositions = scoring.score_turn(guesses[num], answers[num])
+            expected = [[0] * 5 if word == "None" else list(word) for word in data]
+            self.assertEqual(expected, states[num].tolist())
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file
@@ -1,13 +1,15 @@
 import click
+import os
+import time
 from datetime import date, datetime, timedelta
-from app import app, db
-from app.models import User, Word, Puzzle, Game
-from app.api import words
+from app import app, db, profiling
+from app.models import User, Word, Puzzle, Game, Statistics
+from app.api import words, cache, dictionary, stats, users, scheduler, catalog
 
 
 @app.shell_context_processor
 def make_shell_context():
-    return {'db': db, 'User': User, 'Word': Word, 'Puzzle': Puzzle, 'Game': Game}
+    return {'db': db, 'User': User, 'Word': Word, 'Puzzle': Puzzle, 'Game': Game, 'Statistics': Statistics}
 
 # Flask Commands #
 
@@ -24,7 +26,11 @@ def help_command():
                "flask view-p - views a specific puzzle's info.\n" +
                "flask view - views a certain number of puzzles.\n" +
                "flask generate - inserts a certain numbere of puzzles into the database.\n" +
-               "flask update - updates a specific puzzle with new words.")
+               "flask prewarm - generates the puzzles from the next day onwards ahead of time.\n" +
+               "flask update - updates a specific puzzle with new words.\n" +
+               "flask rebuild-stats - rebuilds the puzzle statistics from the games in the database.\n" +
+               "flask build-catalog - builds the catalog of every puzzle the answer words allow.\n" +
+               "flask profile-report - reports the slowest functions of profiled requests by route.")
 
 
 # Only use this in urgent situations. This deletes all puzzles in the database.
@@ -43,6 +49,7 @@ def clear_puzzles(check):
 
         puzzles_deleted = Puzzle.query.delete()
         db.session.commit()
+        cache.daily_puzzle.invalidate()
 
         click.echo("Successfully deleted " + str(puzzles_deleted) + " puzzles.")
     elif check == "all":
@@ -50,8 +57,13 @@ def clear_puzzles(check):
         click.echo("Removed " + str(Word.query.delete()) + " words.")
         click.echo("Removed " + str(Puzzle.query.delete()) + " puzzles.")
         click.echo("Removed " + str(Game.query.delete()) + " games.")
+        Statistics.query.delete()
 
         db.session.commit()
+        dictionary.index.invalidate()
+        users.index.invalidate()
+        cache.daily_puzzle.invalidate()
+        cache.population_statistics.invalidate()
     else:
         click.echo("No confirmation was given to clear puzzles. Refer to flask clear --help for more info.")
 
@@ -65,25 +77,31 @@ def populate_words():
 
     # Populates the database with the words in the wordlists of word-answers.txt and word-guesses.txt.
     try:
+        start = time.perf_counter()
         count = words.populate_database()
+        elapsed = time.perf_counter() - start
+
         click.echo('Successfully populated the database with ' + str(count) + ' words.')
+        click.echo('Took {:.2f}s.'.format(elapsed))
     except:
         click.echo("Something went wrong. Refer to flask populate-words --help for more info.")
 
 
 # Displays the puzzle of the given ID or date.
 # If a puzzle does not exist, an alternative message is displayed.
-# --> flask view-p [ptype] [value]
+# --> flask view-p [ptype] [value] [--format text|csv|json]
 # --> [ptype] must be either id or date
 # --> [value] must be an integer or date
 # --> Example: flask view-p 1/5/2022
 @app.cli.command("view-p")
 @click.argument("ptype")
 @click.argument("value")
-def view_puzzle(ptype, value):
+@click.option("--format", "view_format", type=click.Choice(words.view_formats), default="text",
+              help="The format the puzzle is displayed in.")
+def view_puzzle(ptype, value, view_format):
     """Displays the puzzle of the given ID or date.\n
        If a puzzle does not exist, an alternative message is displayed.\n
-       --> flask view-p [ptype] [value]\n
+       --> flask view-p [ptype] [value] [--format text|csv|json]\n
        --> [ptype] must be either id or date\n
        --> [value] must be an integer or date\n
        --> Example: flask view-p 1/5/2022"""
@@ -101,7 +119,7 @@ def view_puzzle(ptype, value):
         if puzzle is None:
             click.echo('Invalid puzzle ID was entered.')
         else:
-            click.echo(words.get_puzzle_data(puzzle))
+            echo_lines(words.format_puzzle_views([words.get_puzzle_view(puzzle)], view_format))
     elif ptype == "date":
         # Converts the value to the format used in the database. If an exception occurs an invalid format was used.
         try:
@@ -112,34 +130,33 @@ def view_puzzle(ptype, value):
 
         # Checks if the puzzle exists before grabbing the data for it. Ones that do not exist have data generated
         # for it.
-        puzzle = Puzzle.query.filter_by(date=value).first()
-        if puzzle is None:
+        views = list(words.view_puzzles(value, 1))
+        if views[0].puzzleid is None and view_format == "text":
             click.echo('No puzzle with this date exists, the generated puzzle for that date is:\n')
-            puzzle = words.generate_puzzle(value)
-            click.echo(words.get_puzzle_data(puzzle))
-        else:
-            click.echo(words.get_puzzle_data(puzzle))
+        echo_lines(words.format_puzzle_views(views, view_format))
     else:
         click.echo('Invalid type was entered. Refer to flask view-p --help for more info.')
 
 
 # Displays the "number" amount of puzzles, starting from the current day and onwards.
-# If a puzzle does not exist, an alternative message is displayed.
-# --> flask view [number]
+# If a puzzle does not exist, the puzzle that would be generated for that day is displayed without an ID.
+# The puzzles are displayed as they are read, in text, CSV or JSON.
+# --> flask view [number] [--format text|csv|json]
 # --> [number] must be an integer
-# --> Example: flask view 30
+# --> Example: flask view 365 --format csv
 @app.cli.command("view")
 @click.argument("number")
-def view_puzzles(number):
+@click.option("--format", "view_format", type=click.Choice(words.view_formats), default="text",
+              help="The format the puzzles are displayed in.")
+def view_puzzles(number, view_format):
     """Displays the "number" amount of puzzles, starting from the current day and onwards.\n
-       If a puzzle does not exist, an alternative message is displayed.\n
-       --> flask view [number]\n
+       If a puzzle does not exist, the puzzle that would be generated for that day is displayed without an ID.\n
+       --> flask view [number] [--format text|csv|json]\n
        --> [number] must be an integer\n
-       --> Example: flask view 30"""
+       --> Example: flask view 365 --format csv"""
 
-    # Checks if any words exist in the database.
-    wordlist = Word.query.all()
-    if len(wordlist) == 0:
+    # Checks if any words exist in the database, loading the words used to display the puzzles.
+    if len(dictionary.index) == 0:
         click.echo('No words exist in the database, refer to flask populate-words for more info.')
         return
 
@@ -151,14 +168,13 @@ def view_puzzles(number):
         return
 
     # Views the number of puzzles starting from the current day.
-    day = date.today() - timedelta(days=1)
-    for num in range(0, number):
-        day = day + timedelta(days=1)
+    echo_lines(words.format_puzzle_views(words.view_puzzles(date.today(), number), view_format))
 
-        puzzle = Puzzle.query.filter_by(date=day).first()
-        if puzzle is None:
-            puzzle = words.generate_puzzle(day)
-        click.echo(words.get_puzzle_data(puzzle))
+
+# Displays each line as it is generated.
+def echo_lines(lines):
+    for line in lines:
+        click.echo(line)
 
 
 # Generates the "number" amount of puzzles, starting from the current day and onwards.
@@ -174,8 +190,7 @@ def generate_puzzles(number):
        --> [number] must be an integer"""
 
     # Checks if any words exist in the database.
-    wordlist = Word.query.all()
-    if len(wordlist) == 0:
+    if Word.query.first() is None:
         click.echo('No words exist in the database, refer to flask populate-words for more info.')
         return
 
@@ -186,9 +201,32 @@ def generate_puzzles(number):
         click.echo('Any entered numbers must be integers. Refer to flask generate --help for more info.')
         return
 
-    # Generates the specific number of puzzles.
-    words.generate_puzzles(date.today(), number)
-    click.echo('Successfully generated ' + str(number) + ' puzzles.')
+    # Generates the specific number of puzzles, timing the generation.
+    start = time.perf_counter()
+    count = words.generate_puzzles(date.today(), number)
+    elapsed = time.perf_counter() - start
+
+    click.echo('Successfully generated ' + str(count) + ' puzzles (' + str(number - count) + ' already existed).')
+    click.echo('Took {:.2f}s ({:.0f} days/s).'.format(elapsed, number / elapsed if elapsed > 0 else 0))
+
+
+# Generates a week of puzzles from the next day onwards, if any are missing, so that no request generates them.
+# Intended to be run by a scheduled job shortly before midnight, when the app's background prewarm is not enabled.
+# --> flask prewarm
+@app.cli.command("prewarm")
+def prewarm_puzzles():
+    """Generates a week of puzzles from the next day onwards, if any are missing, so that no request generates them.\n
+       Intended to be run by a scheduled job shortly before midnight.\n
+       --> flask prewarm"""
+
+    # Checks if any words exist in the database.
+    if Word.query.first() is None:
+        click.echo('No words exist in the database, refer to flask populate-words for more info.')
+        return
+
+    count, puzzle = scheduler.prewarm()
+    click.echo('Generated ' + str(count) + ' puzzles. The puzzle for ' + str(puzzle.day) + ' is ' +
+               str(puzzle.puzzleid) + ': ' + ', '.join(puzzle.words) + '.')
 
 
 # Updates a specific puzzle based on the given values.
@@ -197,6 +235,7 @@ def generate_puzzles(number):
 # --> [ptype] must be either id or date
 # --> [value] must match the given type and be an integer id or a D/M/Y date
 # --> [word1], [word2] and [word3] must be 5 letter words
+# --> --dry-run only displays the games and users that would be reverted
 # --> Example: flask update date 1/5/2022
 @app.cli.command("update")
 @click.argument("ptype")
@@ -204,19 +243,20 @@ def generate_puzzles(number):
 @click.argument("word1")
 @click.argument("word2")
 @click.argument("word3")
-def update_puzzles(ptype, value, word1, word2, word3):
+@click.option("--dry-run", is_flag=True, help="Only display the games and users that would be reverted.")
+def update_puzzles(ptype, value, word1, word2, word3, dry_run):
     """Updates a specific puzzle based on the given values.\n
        If no puzzle or word exists for the input given, an error is displayed.\n
-       --> flask update [ptype] [value] [word1] [word2] [word3]\n
+       --> flask update [ptype] [value] [word1] [word2] [word3] [--dry-run]\n
        --> [ptype] must be either id or date\n
        --> [value] must match the given type and be an integer id or a D/M/Y date\n
        --> [word1], [word2] and [word3] must be 5 letter words that exist in the database\n
        --> Words must also be allowed answer words, check word-answers.txt for valid words.\n
+       --> --dry-run only displays the games and users that would be reverted\n
        --> Example: flask update date 1/5/2022 trade ether react"""
 
     # Checks if any words exist in the database.
-    wordlist = Word.query.all()
-    if len(wordlist) == 0:
+    if Word.query.first() is None:
         click.echo('No words exist in the database, refer to flask populate-words for more info.')
         return
 
@@ -251,8 +291,7 @@ def update_puzzles(ptype, value, word1, word2, word3):
         if puzzle is None:
             click.echo('Invalid Puzzle ID was entered.')
         else:
-            words.update_puzzle(puzzle, update_words)
-            click.echo('Puzzle was successfully updated.')
+            update_puzzle(puzzle, update_words, dry_run)
 
     elif ptype == "date":
         # Converts the value to the format used in the database. If an exception occurs an invalid format was used.
@@ -267,7 +306,108 @@ def update_puzzles(ptype, value, word1, word2, word3):
         if puzzle is None:
             click.echo('No puzzle with this date exists.')
         else:
-            words.update_puzzle(puzzle, update_words)
-            click.echo('Puzzle was successfully updated.')
+            update_puzzle(puzzle, update_words, dry_run)
+    else:
+        click.echo('Invalid type was entered. Refer to flask update --help for more info.')
+
+
+# Updates a puzzle with the input words, displaying the progress of reverting its games and a summary of the changes.
+def update_puzzle(puzzle, update_words, dry_run):
+    def progress(deleted, games):
+        click.echo('Reverted ' + str(deleted) + ' of ' + str(games) + ' games.')
+
+    summary = words.update_puzzle(puzzle, update_words, dry_run, progress=progress)
+    message = str(summary.games) + ' games and {} ' + str(summary.finished) + ' finished games (' + \
+        str(summary.wins) + ' wins) of ' + str(summary.users) + ' users.'
+    if dry_run:
+        click.echo('Would delete ' + message.format('revert'))
+    else:
+        click.echo('Deleted ' + message.format('reverted'))
+        click.echo('Puzzle was successfully updated.')
+
+
+# Builds the catalog of every puzzle the answer words allow, displaying how many distinct puzzles there are.
+# The catalog is written to PUZZLE_CATALOG, or to the given path. (refer to app/api/catalog.py)
+# --> flask build-catalog [--output path]
+@app.cli.command("build-catalog")
+@click.option("--output", help="The path the catalog is written to, by default PUZZLE_CATALOG.")
+def build_catalog(output):
+    """Builds the catalog of every puzzle the answer words allow, displaying how many distinct puzzles there are.\n
+       The catalog is written to PUZZLE_CATALOG, or to the given path.\n
+       --> flask build-catalog [--output path]"""
+
+    path = output or app.config['PUZZLE_CATALOG']
+    if not path:
+        click.echo('No path was given for the catalog. Set PUZZLE_CATALOG or refer to flask build-catalog --help.')
+        return
+
+    # Checks if any words exist in the database, loading the answer words the catalog is built from.
+    lists = dictionary.index.get_lists()
+    if len(lists) == 0:
+        click.echo('No words exist in the database, refer to flask populate-words for more info.')
+        return
+
+    start = time.perf_counter()
+    puzzles = catalog.build_catalog(path, lists)
+    elapsed = time.perf_counter() - start
+    catalog.index.invalidate()
+
+    click.echo('Wrote ' + str(len(puzzles)) + ' puzzles to ' + path + ' (' + str(os.path.getsize(path)) +
+               ' bytes) in {:.2f}s.'.format(elapsed))
+    click.echo('The ' + str(len(lists.answers)) + ' answer words allow ' + str(catalog.count_distinct(puzzles)) +
+               ' distinct puzzles, not counting rotations of the same words.')
+
+
+# Rebuilds the running totals of each puzzle's statistics from the games in the database, displaying any totals that
+# had drifted from the games.
+# --> flask rebuild-stats [--check]
+# --> --check only displays the drifted totals, without rebuilding them
+@app.cli.command("rebuild-stats")
+@click.option("--check", is_flag=True, help="Only display drifted totals, without rebuilding them.")
+def rebuild_statistics(check):
+    """Rebuilds the running totals of each puzzle's statistics from the games in the database.\n
+       Any totals that had drifted from the games are displayed.\n
+       --> flask rebuild-stats [--check]\n
+       --> --check only displays the drifted totals, without rebuilding them"""
+
+    drift = stats.rebuild_statistics(commit=not check)
+
+    # Displays each drifted total as (games, wins, guesses on wins).
+    for puzzleid, stored, counted in drift:
+        name = "All puzzles" if puzzleid == stats.all_puzzles else "Puzzle " + str(puzzleid)
+        click.echo(name + ": stored " + str(stored) + ", counted " + str(counted) + ".")
+
+    if len(drift) == 0:
+        click.echo("No statistics had drifted.")
+    elif check:
+        click.echo(str(len(drift)) + " statistics have drifted. Run flask rebuild-stats to rebuild them.")
     else:
-        click.echo('Invalid type was entered. Refer to flask update --help for more info.')
\ No newline at end of file
+        click.echo("Rebuilt " + str(len(drift)) + " drifted statistics.")
+
+
+# Merges the profiles of sampled requests (refer to PROFILE_RATE) by route, displaying the top functions of each route
+# by cumulative time.
+# --> flask profile-report [--top N] [--route ROUTE] [--directory DIRECTORY]
+@app.cli.command("profile-report")
+@click.option("--top", default=20, help="The number of functions displayed for each route.")
+@click.option("--route", default=None, help="Only report routes containing this text.")
+@click.option("--directory", default=None, help="The directory of the profiles, PROFILE_DIR by default.")
+def profile_report(top, route, directory):
+    """Displays the top functions of profiled requests by cumulative time, for each route.\n
+       --> flask profile-report [--top N] [--route ROUTE] [--directory DIRECTORY]"""
+
+    directory = directory or app.config['PROFILE_DIR']
+    profiles = profiling.merge_profiles(directory, route)
+    if len(profiles) == 0:
+        click.echo("No profiles were found in " + directory + ". Set PROFILE_RATE to profile requests.")
+        return
+
+    # Routes are displayed with the most total time first.
+    for (method, path), (count, profile) in sorted(profiles.items(), key=lambda item: item[1][1].total_tt,
+                                                   reverse=True):
+        click.echo("\n{} {} ({} profiles, {:.2f}ms per request)".format(method, path, count,
+                                                                       profile.total_tt / count * 1000))
+        click.echo("{:>10} {:>12} {:>12}  {}".format("calls", "tottime ms", "cumtime ms", "function"))
+        for name, calls, total, cumulative in profiling.top_functions(profile, top):
+            click.echo("{:>10} {:>12.3f} {:>12.3f}  {}".format(calls, total / count * 1000,
+                                                             cumulative / count * 1000, name))